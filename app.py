@@ -10,6 +10,7 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 import redis
 from rq import Queue
+from instrumentation import init_instrumentation
 
 logging.basicConfig(level=logging.INFO)
 
@@ -24,6 +25,8 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_recycle": 280, "pool_pre_ping": True}
 
+# Redis를 사용할 수 없으면 conn은 None으로 남고, 시세 캐시는 프로세스 내 L1 캐시만으로 동작
+conn = None
 task_queue = None
 try:
     redis_url = os.environ.get('REDIS_URL')
@@ -55,6 +58,8 @@ def korean_dividend_months_filter(month_names):
     return [month_map.get(m, m) for m in month_names]
 
 db.init_app(app)
+# 요청별 SQL/Redis/외부 API 계측 (Server-Timing 헤더, /metrics 지표)
+init_instrumentation(app, task_queue.connection if task_queue else None)
 
 from models import User
 @login_manager.user_loader
@@ -63,11 +68,19 @@ def load_user(user_id): return User.query.get(int(user_id))
 with app.app_context():
     import models
     db.create_all()
+    # create_all은 이미 존재하는 테이블에 새로 정의된 인덱스를 추가하지 않으므로 누락된 인덱스만 생성
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
     from stock_api import load_us_stocks_data
     load_us_stocks_data()
 
 from routes import main_bp
 app.register_blueprint(main_bp)
 
+# flask cache warm / cache stats / search-index rebuild / snapshots build / lots rebuild / warmup
+from commands import register_commands
+register_commands(app)
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=int(os.environ.get('PORT', 5000)))
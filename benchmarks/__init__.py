@@ -0,0 +1,2 @@
+# 📄 benchmarks/__init__.py
+# 오프라인 성능 벤치마크. 실행 방법은 README의 '성능 벤치마크' 항목 참고.
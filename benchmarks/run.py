@@ -0,0 +1,221 @@
+# 📄 benchmarks/run.py
+"""
+오프라인 성능 벤치마크 실행기.
+
+    python -m benchmarks.run --sizes small medium large --output benchmarks/baselines/latest.json
+    python -m benchmarks.run --compare benchmarks/baselines/baseline.json
+
+규모별(종목/거래/배당 이벤트/상장 종목 수) 합성 데이터에 대해 주요 함수의 실행 시간을 측정하고 JSON으로 저장한다.
+--compare를 주면 이전 결과와 비교하여 실행 시간 증가율 또는 규모 대비 증가 기울기(log-log)가
+허용치를 넘는 항목을 보고하고 종료 코드 1을 반환한다.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+from benchmarks.stubs import install_offline_environment, synthetic_listing
+
+# 규모별 합성 데이터 크기. 각 벤치마크는 이 중 관련된 크기(거래 수, 종목 수 등)를 증가 기울기 계산의 x축으로 사용
+SIZES = {
+    'small': {'symbols': 10, 'trades': 200, 'dividends_per_symbol': 8, 'listed': 2000},
+    'medium': {'symbols': 50, 'trades': 2000, 'dividends_per_symbol': 20, 'listed': 10000},
+    'large': {'symbols': 200, 'trades': 10000, 'dividends_per_symbol': 40, 'listed': 50000},
+}
+QUANTITY_QUERIES = 100
+SEARCH_QUERIES = ('A', 'AB', 'XYZ', 'CORP', 'HOLDINGS', 'NOMATCH')
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def measure(fn, setup=None, repeat=5):
+    """setup(측정 제외) 후 fn을 repeat회 실행한 시간(초) 통계."""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {'median': statistics.median(samples), 'min': min(samples), 'max': max(samples)}
+
+
+def build_benchmarks(size_name, size, market, redis_client):
+    """규모 하나에 대한 (벤치마크 이름, scale, setup, fn) 목록을 만든다. 데이터 생성은 여기서 한 번만 수행."""
+    from app import app, db
+    import stock_api
+    import routes
+    from cache import market_cache
+    from flask_login import login_user
+    from models import User, recalculate_holdings
+    from tasks import get_quantity_on_date, update_all_dividends_for_user
+    from services.portfolio_service import get_portfolio_analysis_data, get_monthly_dividend_distribution
+    from benchmarks.synthetic import create_synthetic_user, clear_user_dividends, random_holding_queries
+
+    market.dividends_per_symbol = size['dividends_per_symbol']
+    user_id = create_synthetic_user(f"bench_{size_name}_{int(time.time() * 1000)}", size['symbols'], size['trades'])
+    update_all_dividends_for_user(user_id, force=True)
+    queries = random_holding_queries(user_id, QUANTITY_QUERIES)
+    # 검색 대상 규모를 바꾸고 검색 인덱스를 다시 생성
+    stock_api.US_STOCKS_LIST[:] = synthetic_listing(size['listed'])
+    stock_api.build_search_index()
+
+    def flush_cache():
+        market_cache.local.clear()
+        if redis_client is not None:
+            redis_client.flushall()
+
+    def analysis():
+        with app.test_request_context('/'):
+            return get_portfolio_analysis_data(user_id)
+
+    def quantity_lookups():
+        for symbol, target_date in queries:
+            get_quantity_on_date(user_id, symbol, target_date)
+
+    with app.test_request_context('/'):
+        dividend_metrics = get_portfolio_analysis_data(user_id)['dividend_metrics']
+
+    def monthly_distribution():
+        with app.test_request_context('/'):
+            get_monthly_dividend_distribution(dividend_metrics)
+
+    user = db.session.get(User, user_id)
+
+    def search():
+        for q in SEARCH_QUERIES:
+            with app.test_request_context(f'/api/search-stocks?q={q}'):
+                login_user(user)
+                routes.search_stocks()
+
+    def dividends_setup():
+        clear_user_dividends(user_id)
+
+    trades, symbols = size['trades'], size['symbols']
+    events = size['symbols'] * size['dividends_per_symbol']
+    return [
+        ('recalculate_holdings', trades, None, lambda: recalculate_holdings(user_id)),
+        (f'get_quantity_on_date x{QUANTITY_QUERIES}', trades, None, quantity_lookups),
+        ('update_all_dividends_for_user', trades + events, dividends_setup, lambda: update_all_dividends_for_user(user_id, force=True)),
+        ('get_portfolio_analysis_data[cold]', symbols, flush_cache, analysis),
+        ('get_portfolio_analysis_data[warm]', symbols, None, analysis),
+        ('get_monthly_dividend_distribution', symbols, None, monthly_distribution),
+        (f'search_stocks x{len(SEARCH_QUERIES)}', size['listed'], None, search),
+    ]
+
+
+def scaling_exponent(points):
+    """(규모, 시간) 점들의 log-log 기울기. 1이면 선형, 2이면 제곱으로 증가."""
+    points = [(x, y) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    xs = [math.log(x) for x, _ in points]
+    ys = [math.log(y) for _, y in points]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator if denominator else None
+
+
+def run(size_names, repeat, latency):
+    workdir = tempfile.mkdtemp(prefix='wealth_tracker_bench_')
+    market = install_offline_environment(workdir, latency=latency)
+    from app import app, task_queue
+    logging.getLogger().setLevel(logging.WARNING)
+    redis_client = task_queue.connection if task_queue else None
+
+    results = {}
+    with app.app_context():
+        for size_name in size_names:
+            size = SIZES[size_name]
+            print(f"[{size_name}] {size}", file=sys.stderr)
+            for name, scale, setup, fn in build_benchmarks(size_name, size, market, redis_client):
+                stats = measure(fn, setup=setup, repeat=repeat)
+                results.setdefault(name, {})[size_name] = dict(stats, scale=scale)
+                print(f"  {name:<40} {stats['median'] * 1000:10.2f} ms", file=sys.stderr)
+
+    scaling = {name: scaling_exponent([(r['scale'], r['median']) for r in by_size.values()]) for name, by_size in results.items()}
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'upstream_latency': latency,
+            'redis': 'fakeredis' if redis_client is not None else None,
+            'sizes': {n: SIZES[n] for n in size_names},
+        },
+        'results': results,
+        'scaling': scaling,
+    }
+
+
+def compare(current, baseline, time_tolerance, scaling_tolerance):
+    """이전 결과 대비 회귀 항목 목록. 실행 시간은 비율로, 증가 기울기는 차이로 비교한다."""
+    regressions = []
+    for name, by_size in current['results'].items():
+        for size_name, result in by_size.items():
+            base = baseline.get('results', {}).get(name, {}).get(size_name)
+            if not base or not base.get('median'):
+                continue
+            ratio = result['median'] / base['median']
+            if ratio > 1 + time_tolerance:
+                regressions.append(f"{name} [{size_name}]: {base['median'] * 1000:.2f} ms -> {result['median'] * 1000:.2f} ms (x{ratio:.2f})")
+        current_slope, base_slope = current['scaling'].get(name), baseline.get('scaling', {}).get(name)
+        if current_slope is not None and base_slope is not None and current_slope - base_slope > scaling_tolerance:
+            regressions.append(f"{name} 증가 기울기: {base_slope:.2f} -> {current_slope:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wealth Tracker 오프라인 성능 벤치마크")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--upstream-latency-ms', type=float, default=0.0, help="가짜 시세 API 호출당 지연 시간")
+    parser.add_argument('--output', default='benchmarks/baselines/latest.json')
+    parser.add_argument('--compare', help="비교할 이전 결과 JSON 파일")
+    parser.add_argument('--time-tolerance', type=float, default=0.5, help="허용 실행 시간 증가율 (0.5 = 50%%)")
+    parser.add_argument('--scaling-tolerance', type=float, default=0.3, help="허용 log-log 기울기 증가량")
+    args = parser.parse_args(argv)
+
+    # 실행 중 작업 디렉터리가 임시 디렉터리로 바뀌므로 경로를 먼저 절대 경로로 변환
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    report = run(args.sizes, args.repeat, args.upstream_latency_ms / 1000)
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"결과 저장: {output}", file=sys.stderr)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.time_tolerance, args.scaling_tolerance)
+        if regressions:
+            print("성능 회귀 감지:", file=sys.stderr)
+            for line in regressions:
+                print(f"  - {line}", file=sys.stderr)
+            return 1
+        print("기준 결과 대비 회귀 없음.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# 📄 benchmarks/stubs.py
+"""
+벤치마크용 오프라인 실행 환경.
+앱을 import하기 전에 install_offline_environment()를 호출하면 임시 SQLite DB, 프로세스 내 Redis(fakeredis),
+네트워크 없이 결정적인 데이터를 돌려주는 yfinance 대체 객체로 앱이 초기화된다.
+"""
+
+import os
+import json
+import time
+import zlib
+import logging
+from datetime import date
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def _symbol_seed(symbol):
+    return zlib.crc32(symbol.encode())
+
+
+class FakeMarket:
+    """
+    yfinance의 download / Tickers / Ticker를 대체하는 결정적 시세 데이터 소스.
+    종목별 시세는 심볼 해시로 정해지는 랜덤 워크이며, 배당은 분기마다 dividends_per_symbol회 발생한다.
+    latency(초)를 주면 외부 API 호출 한 번마다 그만큼 대기하여 네트워크 비용을 흉내 낸다.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.dividends_per_symbol = 8
+        self.calls = {'download': 0, 'info': 0, 'actions': 0, 'history': 0}
+
+    def _wait(self, kind):
+        self.calls[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def closes(self, symbol, index):
+        rng = np.random.default_rng(_symbol_seed(symbol))
+        steps = rng.normal(0.0003, 0.015, len(index))
+        return 20 + (_symbol_seed(symbol) % 300) * np.exp(np.cumsum(steps))
+
+    def dividend_dates(self, end=None):
+        end = pd.Timestamp(end or date.today()).normalize()
+        return pd.DatetimeIndex(sorted(end - pd.DateOffset(months=3 * i) for i in range(self.dividends_per_symbol)))
+
+    def dividend_amount(self, symbol):
+        return round(0.1 + (_symbol_seed(symbol) % 100) / 100, 4)
+
+    def download(self, tickers, period=None, start=None, actions=False, **kwargs):
+        self._wait('download')
+        symbols = tickers.split() if isinstance(tickers, str) else list(tickers)
+        end = pd.Timestamp(date.today())
+        if start is not None:
+            index = pd.bdate_range(start=start, end=end)
+        else:
+            days = {'5d': 5, '1mo': 21, '6mo': 126, '1y': 252}.get(period, 252)
+            index = pd.bdate_range(end=end, periods=days)
+        fields = ['Close', 'Dividends'] if actions else ['Close']
+        columns = pd.MultiIndex.from_product([fields, symbols])
+        frame = pd.DataFrame(0.0, index=index, columns=columns)
+        for symbol in symbols:
+            frame[('Close', symbol)] = self.closes(symbol, index)
+            if actions:
+                ex_dates = self.dividend_dates().intersection(index)
+                frame.loc[ex_dates, ('Dividends', symbol)] = self.dividend_amount(symbol)
+        return frame
+
+    def Tickers(self, symbols):
+        market = self
+
+        class _Tickers:
+            tickers = {s: market.Ticker(s) for s in symbols.split()}
+        return _Tickers()
+
+    def Ticker(self, symbol):
+        market = self
+
+        class _Ticker:
+            @property
+            def info(self):
+                market._wait('info')
+                sectors = ['Technology', 'Healthcare', 'Financial Services', 'Energy', 'Consumer Defensive', 'Utilities']
+                return {
+                    'longName': f"{symbol} Holdings Inc.", 'sector': sectors[_symbol_seed(symbol) % len(sectors)],
+                    'industry': 'Synthetic', 'dividendRate': market.dividend_amount(symbol) * 4, 'website': '',
+                }
+
+            @property
+            def actions(self):
+                market._wait('actions')
+                ex_dates = market.dividend_dates()
+                return pd.DataFrame({'Dividends': market.dividend_amount(symbol), 'Stock Splits': 0.0}, index=ex_dates)
+
+            def history(self, period='6mo', **kwargs):
+                market._wait('history')
+                return market.download(symbol, period=period)['Close'].rename(columns={symbol: 'Close'})
+
+        return _Ticker()
+
+
+def synthetic_listing(n_listed, seed=0):
+    """검색 벤치마크용 상장 종목 목록 (SEC company_tickers 형식)."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    listing, seen = [], set()
+    while len(listing) < n_listed:
+        ticker = ''.join(rng.choice(letters, rng.integers(1, 6)))
+        if ticker in seen:
+            continue
+        seen.add(ticker)
+        listing.append({'ticker': ticker, 'name': f"{ticker} {rng.choice(['Corp', 'Inc', 'Holdings', 'Group', 'Trust'])}"})
+    return listing
+
+
+def install_offline_environment(workdir, latency=0.0):
+    """
+    앱 import 전에 호출. 환경 변수와 모듈을 바꿔 앱이 외부 네트워크 없이 동작하게 한다.
+    반환값은 FakeMarket 인스턴스이며, Redis를 사용할 수 없으면(fakeredis 미설치) 캐시 없이 실행된다.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+    if fakeredis is not None:
+        import redis
+        server = fakeredis.FakeServer()
+        redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+        os.environ['REDIS_URL'] = 'redis://benchmark'
+    else:
+        logger.warning("fakeredis가 설치되어 있지 않아 Redis 캐시 없이 벤치마크를 실행합니다.")
+        os.environ.pop('REDIS_URL', None)
+
+    import yfinance as yf
+    market = FakeMarket(latency=latency)
+    yf.download, yf.Tickers, yf.Ticker = market.download, market.Tickers, market.Ticker
+
+    # load_us_stocks_data가 SEC API 대신 작업 디렉터리의 파일 캐시를 사용하도록 준비
+    os.chdir(workdir)
+    with open('us_stocks.json', 'w') as f:
+        json.dump(synthetic_listing(1000), f)
+    return market
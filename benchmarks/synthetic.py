@@ -0,0 +1,71 @@
+# 📄 benchmarks/synthetic.py
+"""합성 포트폴리오 생성기. 종목 수, 거래 수, 배당 이벤트 수를 지정해 사용자 하나의 거래 기록을 만든다."""
+
+import random
+from datetime import date, timedelta
+from sqlalchemy import insert
+from app import db
+from models import User, Trade, Holding, Dividend, DividendUpdateCache, recalculate_holdings
+
+
+def synthetic_symbols(n_symbols):
+    """SYN0001 형식의 가상 종목 심볼 (실제 티커와 겹치지 않음)."""
+    return [f"SYN{i:04d}" for i in range(n_symbols)]
+
+
+def generate_trades(user_id, symbols, n_trades, years=5, seed=0):
+    """
+    거래 dict 리스트를 날짜순으로 생성. 매도는 항상 그 시점 보유 수량의 절반 이하로만 만들어
+    모든 거래 기록이 유효한(보유 수량이 음수가 되지 않는) 상태가 되도록 한다.
+    """
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * years)
+    span = (date.today() - start).days
+    trade_dates = sorted(start + timedelta(days=rng.randrange(span)) for _ in range(n_trades))
+
+    positions = dict.fromkeys(symbols, 0)
+    trades = []
+    for trade_date in trade_dates:
+        symbol = rng.choice(symbols)
+        price = round(rng.uniform(10, 500), 2)
+        if positions[symbol] > 1 and rng.random() < 0.3:
+            quantity = rng.randint(1, int(positions[symbol] // 2))
+            trade_type = 'sell'
+            positions[symbol] -= quantity
+        else:
+            quantity = rng.randint(1, 50)
+            trade_type = 'buy'
+            positions[symbol] += quantity
+        trades.append({'symbol': symbol, 'trade_type': trade_type, 'quantity': float(quantity),
+                       'price': price, 'trade_date': trade_date, 'user_id': user_id})
+    return trades
+
+
+def create_synthetic_user(name, n_symbols, n_trades, seed=0):
+    """가상 사용자와 거래 기록을 생성하고 보유 종목을 계산. 생성된 사용자 id를 반환."""
+    user = User(username=name, email=f"{name}@benchmark.local")
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+
+    trades = generate_trades(user.id, synthetic_symbols(n_symbols), n_trades, seed=seed)
+    for start in range(0, len(trades), 1000):
+        db.session.execute(insert(Trade), trades[start:start + 1000])
+    db.session.commit()
+    recalculate_holdings(user.id)
+    return user.id
+
+
+def clear_user_dividends(user_id):
+    """배당 갱신 작업을 처음부터 다시 측정할 수 있도록 사용자의 배당 기록과 갱신 시각을 삭제."""
+    Dividend.query.filter_by(user_id=user_id).delete()
+    DividendUpdateCache.query.filter_by(user_id=user_id).delete()
+    db.session.commit()
+
+
+def random_holding_queries(user_id, n_queries, seed=0):
+    """get_quantity_on_date 벤치마크용 (종목, 날짜) 조회 목록."""
+    rng = random.Random(seed)
+    symbols = [h.symbol for h in Holding.query.filter_by(user_id=user_id).all()]
+    start = date.today() - timedelta(days=365 * 5)
+    return [(rng.choice(symbols), start + timedelta(days=rng.randrange(365 * 5))) for _ in range(n_queries)] if symbols else []
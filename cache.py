@@ -0,0 +1,225 @@
+# 📄 cache.py
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from redis.exceptions import RedisError
+from instrumentation import current_stats, metrics_registry
+from pubsub_listener import PubSubListener, pubsub_listener
+
+try:
+    from app import conn as redis_conn
+except ImportError:
+    redis_conn = None
+    logging.warning("Redis 연결을 가져오지 못했습니다. 프로세스 내 캐시만 사용합니다.")
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 5000))
+LOCAL_CACHE_MAX_BYTES = int(os.environ.get('LOCAL_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Redis가 정상일 때 L1 항목의 최대 수명. 다른 워커가 값을 바꿨는데 무효화 메시지를 놓쳐도 이 시간 뒤에는 Redis 값을 다시 읽는다
+LOCAL_CACHE_TTL_SECONDS = int(os.environ.get('LOCAL_CACHE_TTL_SECONDS', 60))
+CACHE_INVALIDATION_ENABLED = os.environ.get('CACHE_INVALIDATION', '1').lower() in ('1', 'true', 'yes')
+CACHE_INVALIDATION_CHANNEL = 'cache_invalidation'
+# Redis 명령이 실패하면 이 시간 동안 Redis를 건너뛰고 L1만 사용 (요청마다 연결 타임아웃을 기다리지 않도록)
+REDIS_RETRY_SECONDS = 30
+
+
+class LocalTTLCache:
+    """
+    프로세스 내 LRU + TTL 캐시. 값은 JSON 문자열(또는 Redis에서 읽은 바이트)로 저장하여
+    호출자가 반환값을 수정해도 캐시가 오염되지 않고, 항목 크기를 정확히 집계할 수 있다.
+    항목 수(max_entries)나 전체 크기(max_bytes)를 넘으면 가장 오래 사용하지 않은 항목부터 제거한다.
+    """
+
+    def __init__(self, max_entries=LOCAL_CACHE_MAX_ENTRIES, max_bytes=LOCAL_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # {key: (만료 시각, raw)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, raw, ttl_seconds):
+        if ttl_seconds <= 0 or len(raw) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl_seconds, raw)
+            self._bytes += len(raw)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, raw = self._entries.pop(key)
+        self._bytes -= len(raw)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class TieredCache:
+    """
+    L1(LocalTTLCache) 뒤에 L2(Redis)를 둔 JSON 캐시.
+    - 조회: L1에 없는 키만 한 번의 MGET으로 Redis에서 읽고 L1에 채운다.
+    - 저장: Redis에 쓰고 무효화 채널로 키를 발행하여 다른 워커의 L1 항목을 지운다.
+    - Redis가 없거나 명령이 실패하면 L1만으로 동작하며, 이때는 L1 항목을 요청된 TTL 전체 동안 유지한다.
+    - Redis 전용 명령은 redis_call()로 실행하여 같은 장애 감지/재시도 대기를 공유한다.
+    """
+
+    def __init__(self, redis_client, local=None, local_ttl=LOCAL_CACHE_TTL_SECONDS,
+                 invalidation_channel=CACHE_INVALIDATION_CHANNEL if CACHE_INVALIDATION_ENABLED else None, listener=None):
+        self.redis = redis_client
+        self.local = local or LocalTTLCache()
+        self.local_ttl = local_ttl
+        self.channel = invalidation_channel if redis_client is not None else None
+        self._redis_down_until = 0
+        self._node_id = None
+        self._node_pid = None
+        self.listener = listener or PubSubListener(redis_client)
+        if self.channel:
+            self.listener.register(self.channel, self._on_invalidation)
+
+    @property
+    def redis_available(self):
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, error):
+        if time.monotonic() >= self._redis_down_until:
+            logger.warning(f"Redis 캐시 명령 실패, {REDIS_RETRY_SECONDS}초 동안 프로세스 내 캐시만 사용합니다: {error}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def redis_call(self, command, default=None):
+        """
+        L1에 두지 않는 Redis 전용 명령(버전 카운터, 조각 캐시, pub/sub 발행 등)을 command(redis)로 실행.
+        Redis가 없거나 재시도 대기 중이거나 명령이 실패하면 default를 반환한다.
+        """
+        if not self.redis_available:
+            return default
+        try:
+            return command(self.redis)
+        except RedisError as e:
+            self._redis_failed(e)
+            return default
+
+    def get_many(self, keys):
+        """키 순서대로 값(없으면 None) 리스트를 반환."""
+        self._ensure_listener()
+        results = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            raw = self.local.get(key)
+            if raw is None:
+                missing.append(i)
+            else:
+                results[i] = json.loads(raw)
+
+        stats = current_stats()
+        if stats is not None and len(missing) < len(keys):
+            stats.record_local_hits(key for i, key in enumerate(keys) if results[i] is not None)
+
+        if missing and self.redis_available:
+            try:
+                values = self.redis.mget([keys[i] for i in missing])
+            except RedisError as e:
+                self._redis_failed(e)
+                values = [None] * len(missing)
+            for i, raw in zip(missing, values):
+                if raw:
+                    results[i] = json.loads(raw)
+                    self.local.set(keys[i], raw, self.local_ttl)
+        return results
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def set_many(self, items):
+        """{키: (값, TTL timedelta)} 형태의 항목을 저장. Redis에는 하나의 파이프라인으로 쓴다."""
+        if not items:
+            return
+        self._ensure_listener()
+        serialized = {key: (json.dumps(value), ttl) for key, (value, ttl) in items.items()}
+
+        redis_ok = self.redis_available
+        if redis_ok:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, (raw, ttl) in serialized.items():
+                    pipe.setex(key, ttl, raw)
+                if self.channel:
+                    pipe.publish(self.channel, json.dumps({'origin': self._node_id, 'keys': list(serialized)}))
+                pipe.execute()
+            except RedisError as e:
+                self._redis_failed(e)
+                redis_ok = False
+
+        for key, (raw, ttl) in serialized.items():
+            ttl_seconds = ttl.total_seconds()
+            self.local.set(key, raw, min(ttl_seconds, self.local_ttl) if redis_ok else ttl_seconds)
+
+    def set(self, key, value, ttl):
+        self.set_many({key: (value, ttl)})
+
+    def _ensure_listener(self):
+        if not self.channel:
+            return
+        # fork된 워커마다 자신이 발행한 무효화 메시지를 구분할 수 있도록 pid별로 node id를 새로 만든다
+        if self._node_pid != os.getpid():
+            self._node_pid = os.getpid()
+            self._node_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.listener.start()
+
+    def _on_invalidation(self, event):
+        if event.get('origin') != self._node_id:
+            self.local.delete(event.get('keys', []))
+
+
+market_cache = TieredCache(redis_conn, listener=pubsub_listener)
+
+
+def _local_cache_samples():
+    stats = market_cache.local.stats()
+    return [
+        ('wealth_tracker_local_cache_entries', {}, stats['entries']),
+        ('wealth_tracker_local_cache_bytes', {}, stats['bytes']),
+        ('wealth_tracker_local_cache_lookups_total', {'result': 'hit'}, stats['hits']),
+        ('wealth_tracker_local_cache_lookups_total', {'result': 'miss'}, stats['misses']),
+        ('wealth_tracker_local_cache_evictions_total', {}, stats['evictions']),
+    ]
+
+
+# 누적 지표도 같은 Redis 장애 감지/재시도 대기를 거쳐 저장
+metrics_registry.store = market_cache
+metrics_registry.add_process_collector(_local_cache_samples)
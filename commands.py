@@ -0,0 +1,225 @@
+# 📄 commands.py
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from redis.exceptions import ResponseError
+from app import db
+from models import Holding, User, Trade, TaxLot, recalculate_holdings
+from utils import redis_conn
+import stock_api as stock_api_module
+from services.market_data_loader import MarketDataLoader, ALL_KINDS, PRICE, PROFILE, DIVIDEND_METRICS, PAYOUT_SCHEDULE
+from services.portfolio_service import get_portfolio_snapshot
+
+logger = logging.getLogger(__name__)
+
+# cache stats에서 크기를 집계할 키 접두사
+CACHE_KEY_PREFIXES = ALL_KINDS + ('history', 'returns', 'risk_returns', 'portfolio_snapshot', 'portfolio_version', 'fragment')
+
+cache_cli = AppGroup('cache', help="Redis 시세 캐시 관리")
+search_index_cli = AppGroup('search-index', help="종목 검색 인덱스 관리")
+snapshots_cli = AppGroup('snapshots', help="사용자별 포트폴리오 스냅샷 관리")
+lots_cli = AppGroup('lots', help="매수 lot 원장(TaxLot/LotRealization) 관리")
+
+
+def _held_symbols():
+    return sorted({s for (s,) in db.session.query(Holding.symbol).distinct().all()})
+
+
+def _warm_batch(app, symbols):
+    """종목 묶음 하나의 시세/프로필/배당 지표/배당 일정을 벌크 조회 1회씩으로 캐시에 채운다."""
+    with app.app_context():
+        loader = MarketDataLoader().require(symbols)
+        return {
+            PRICE: len(loader.prices(symbols)),
+            PROFILE: len(loader.profiles(symbols)),
+            DIVIDEND_METRICS: len(loader.annual_dividends(symbols)),
+            PAYOUT_SCHEDULE: len(loader.payout_schedules(symbols)),
+        }
+
+
+def warm_caches(batch_size=25, workers=4):
+    """보유 중인 모든 종목의 캐시를 batch_size개씩 묶어 workers개 스레드로 병렬 예열. 종류별 채워진 종목 수를 반환."""
+    symbols = _held_symbols()
+    batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+    totals = dict.fromkeys(ALL_KINDS, 0)
+    app = current_app._get_current_object()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_warm_batch, app, batch) for batch in batches]
+        for future in as_completed(futures):
+            try:
+                for kind, count in future.result().items():
+                    totals[kind] += count
+            except Exception as e:
+                logger.error(f"캐시 예열 배치 실패: {e}")
+    return len(symbols), totals
+
+
+def build_snapshots(user_id=None):
+    """사용자별 포트폴리오 스냅샷을 다시 계산해 저장. (성공, 실패) 사용자 수를 반환."""
+    user_ids = [user_id] if user_id else [uid for (uid,) in db.session.query(Holding.user_id).distinct().all()]
+    built = failed = 0
+    for uid in user_ids:
+        try:
+            if get_portfolio_snapshot(uid, refresh=True):
+                built += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f"User {uid} 스냅샷 계산 실패: {e}")
+            db.session.rollback()
+    return built, failed
+
+
+@cache_cli.command('warm')
+@click.option('--batch-size', default=25, show_default=True, help="벌크 조회 한 번에 묶을 종목 수")
+@click.option('--workers', default=4, show_default=True, help="동시에 처리할 배치 수")
+def warm_command(batch_size, workers):
+    """보유 중인 모든 종목의 시세/프로필/배당 캐시를 예열."""
+    if redis_conn is None:
+        click.echo("Redis를 사용할 수 없어 캐시 예열을 건너뜁니다.")
+        return
+    started = time.perf_counter()
+    count, totals = warm_caches(batch_size, workers)
+    summary = ', '.join(f"{kind} {n}/{count}" for kind, n in totals.items())
+    click.echo(f"캐시 예열 완료 ({time.perf_counter() - started:.1f}초): {summary}")
+
+
+def _key_size(key, use_memory_usage):
+    if use_memory_usage:
+        return redis_conn.memory_usage(key) or 0
+    return redis_conn.strlen(key) if redis_conn.type(key) in (b'string', 'string') else 0
+
+
+@cache_cli.command('stats')
+def stats_command():
+    """보유 종목 기준 캐시 적중 범위(coverage)와 키 접두사별 개수/크기 통계를 출력."""
+    if redis_conn is None:
+        click.echo("Redis를 사용할 수 없습니다.")
+        return
+
+    symbols = _held_symbols()
+    if symbols:
+        pipe = redis_conn.pipeline(transaction=False)
+        for kind in ALL_KINDS:
+            for symbol in symbols:
+                pipe.exists(f"{kind}:{symbol}")
+        flags = pipe.execute()
+        click.echo(f"보유 종목 {len(symbols)}개 캐시 coverage:")
+        for i, kind in enumerate(ALL_KINDS):
+            cached = sum(flags[i * len(symbols):(i + 1) * len(symbols)])
+            click.echo(f"  {kind:<26} {cached:>6}/{len(symbols):<6} ({cached / len(symbols) * 100:5.1f}%)")
+
+    try:
+        redis_conn.memory_usage('__probe__')
+        use_memory_usage = True
+    except ResponseError:
+        # MEMORY USAGE를 지원하지 않는 Redis 호환 서버는 문자열 길이로 대신 집계
+        use_memory_usage = False
+
+    click.echo(f"키 접두사별 크기 ({'MEMORY USAGE' if use_memory_usage else 'STRLEN'} 기준):")
+    click.echo(f"  {'prefix':<26} {'keys':>8} {'total KB':>10} {'avg B':>8} {'max B':>8}")
+    for prefix in CACHE_KEY_PREFIXES:
+        sizes = [_key_size(key, use_memory_usage) for key in redis_conn.scan_iter(match=f"{prefix}:*", count=1000)]
+        if not sizes:
+            click.echo(f"  {prefix:<26} {0:>8}")
+            continue
+        click.echo(f"  {prefix:<26} {len(sizes):>8} {sum(sizes) / 1024:>10.1f} {sum(sizes) / len(sizes):>8.0f} {max(sizes):>8}")
+
+
+@search_index_cli.command('rebuild')
+@click.option('--refresh/--no-refresh', default=True, show_default=True, help="SEC에서 종목 목록 파일을 새로 받을지 여부")
+def rebuild_search_index_command(refresh):
+    """종목 목록 파일(us_stocks.json)을 갱신하고 검색 인덱스를 다시 생성."""
+    started = time.perf_counter()
+    if refresh:
+        stock_api_module.load_us_stocks_data(force=True)
+    else:
+        stock_api_module.build_search_index()
+    click.echo(f"검색 인덱스 생성 완료 ({time.perf_counter() - started:.1f}초): "
+               f"종목 {len(stock_api_module.US_STOCKS_LIST)}개, 접두사 {len(stock_api_module.SEARCH_INDEX)}개")
+
+
+@snapshots_cli.command('build')
+@click.option('--user-id', type=int, help="특정 사용자만 계산")
+def build_snapshots_command(user_id):
+    """사용자별 포트폴리오 스냅샷을 미리 계산."""
+    if user_id and not db.session.get(User, user_id):
+        raise click.BadParameter(f"사용자 {user_id}을(를) 찾을 수 없습니다.", param_hint='--user-id')
+    started = time.perf_counter()
+    built, failed = build_snapshots(user_id)
+    click.echo(f"스냅샷 계산 완료 ({time.perf_counter() - started:.1f}초): 성공 {built}명, 실패 {failed}명")
+
+
+def rebuild_lots(user_id=None, missing_only=True):
+    """
+    거래 기록을 재생하여 lot 원장을 다시 계산. missing_only면 거래는 있지만 lot이 하나도 없는 사용자
+    (lot 원장 도입 이전 데이터)만 처리한다.
+    lot 원장 도입 이전에는 과거 날짜 매도로 보유 수량을 초과한 거래가 저장될 수 있었으므로, 초과 매도가 있어도
+    사용자 전체를 실패로 처리하지 않고 초과분만 제외해 계산한다.
+    (성공 사용자 수, 실패 사용자 수, 초과 매도 목록 [(user_id, trade_id, symbol, 초과 수량), ...])을 반환.
+    """
+    if user_id:
+        user_ids = [user_id]
+    else:
+        query = db.session.query(Trade.user_id).distinct()
+        if missing_only:
+            query = query.filter(~Trade.user_id.in_(db.session.query(TaxLot.user_id).distinct()))
+        user_ids = [uid for (uid,) in query.all()]
+    rebuilt = failed = 0
+    unmatched = []
+    for uid in user_ids:
+        try:
+            unmatched += [(uid, *sell) for sell in recalculate_holdings(uid, clamp_unmatched=True)]
+            rebuilt += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f"User {uid} lot 원장 계산 실패: {e}")
+            db.session.rollback()
+    return rebuilt, failed, unmatched
+
+
+@lots_cli.command('rebuild')
+@click.option('--user-id', type=int, help="특정 사용자만 계산")
+@click.option('--all', 'all_users', is_flag=True, help="lot 원장이 이미 있는 사용자도 다시 계산")
+def rebuild_lots_command(user_id, all_users):
+    """
+    거래 기록으로 lot 원장과 보유 종목을 다시 계산. 기본값은 lot 원장이 없는 사용자만.
+    보유 수량을 초과한 매도 거래는 초과분을 제외하고 계산한 뒤 목록으로 출력한다. 해당 종목은 거래를 추가/삭제할 때
+    다시 검증되어 거부되므로, 출력된 매도 거래를 삭제(필요하면 올바른 수량으로 다시 추가)하거나 그 이전 날짜의
+    누락된 매수 거래를 추가하여 데이터를 바로잡는다. 두 경우 모두 해당 종목의 lot이 다시 계산된다.
+    """
+    if user_id and not db.session.get(User, user_id):
+        raise click.BadParameter(f"사용자 {user_id}을(를) 찾을 수 없습니다.", param_hint='--user-id')
+    started = time.perf_counter()
+    rebuilt, failed, unmatched = rebuild_lots(user_id, missing_only=not all_users)
+    click.echo(f"lot 원장 계산 완료 ({time.perf_counter() - started:.1f}초): 성공 {rebuilt}명, 실패 {failed}명")
+    if unmatched:
+        click.echo(f"보유 수량을 초과한 매도 거래 {len(unmatched)}건 (초과분은 실현 손익에서 제외됨, 수정 필요):")
+        for uid, trade_id, symbol, quantity in unmatched:
+            click.echo(f"  user_id={uid} symbol={symbol} trade_id={trade_id} 초과 수량={quantity:g}")
+
+
+@click.command('warmup')
+@click.option('--refresh-listing/--no-refresh-listing', default=True, show_default=True)
+@click.pass_context
+def warmup_command(ctx, refresh_listing):
+    """배포 직후 실행: 검색 인덱스 재생성, 누락된 lot 원장 계산, 시세 캐시 예열, 포트폴리오 스냅샷 계산. 실패해도 앱 시작을 막지 않는다."""
+    for command, kwargs in ((rebuild_search_index_command, {'refresh': refresh_listing}),
+                            (rebuild_lots_command, {'user_id': None, 'all_users': False}),
+                            (warm_command, {}),
+                            (build_snapshots_command, {})):
+        try:
+            ctx.invoke(command, **kwargs)
+        except Exception as e:
+            logger.error(f"warmup 단계 '{command.name}' 실패: {e}")
+
+
+def register_commands(app):
+    app.cli.add_command(cache_cli)
+    app.cli.add_command(search_index_cli)
+    app.cli.add_command(snapshots_cli)
+    app.cli.add_command(lots_cli)
+    app.cli.add_command(warmup_command)
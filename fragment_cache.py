@@ -0,0 +1,68 @@
+# 📄 fragment_cache.py
+
+import gzip
+import json
+import logging
+from datetime import timedelta
+from flask import request, current_app
+from markupsafe import Markup
+from cache import market_cache
+from services.portfolio_service import get_snapshot_version, SNAPSHOT_TTL_HOURS
+
+logger = logging.getLogger(__name__)
+
+# 조각은 스냅샷에서 파생되므로 스냅샷과 같은 수명을 사용
+FRAGMENT_TTL = timedelta(hours=SNAPSHOT_TTL_HOURS)
+GZIP_LEVEL = 6
+
+
+def _fragment_key(name, user_id, version):
+    return f"fragment:{name}:{user_id}:{version}"
+
+
+def _cached_gzip(name, user_id, version, produce):
+    """
+    produce()가 만든 바이트를 gzip으로 압축해 스냅샷 버전별로 캐시하고 압축된 바이트를 반환.
+    version이 None(보유 종목 없음)이거나 Redis를 사용할 수 없으면 캐시하지 않는다.
+    """
+    if version is not None:
+        cached = market_cache.redis_call(lambda r: r.get(_fragment_key(name, user_id, version)))
+        if cached:
+            return cached
+
+    compressed = gzip.compress(produce(), GZIP_LEVEL)
+    if version is not None and market_cache.redis_available:
+        # 렌더링 중 시세가 새로 조회되면 스냅샷 버전이 바뀌므로 렌더링 후의 버전으로 저장
+        key = _fragment_key(name, user_id, get_snapshot_version(user_id))
+        market_cache.redis_call(lambda r: r.setex(key, FRAGMENT_TTL, compressed))
+    return compressed
+
+def cached_fragment(name, user_id, version, render):
+    """render()가 반환하는 HTML 조각을 캐시. 버전이 같으면 Jinja 렌더링 없이 저장된 HTML을 그대로 사용한다."""
+    compressed = _cached_gzip(name, user_id, version, lambda: render().encode())
+    return Markup(gzip.decompress(compressed).decode())
+
+
+def cached_json(name, user_id, version, build):
+    """build()가 반환하는 객체의 JSON을 캐시. 응답 본문으로 바로 쓸 수 있도록 gzip 압축된 바이트를 반환한다."""
+    return _cached_gzip(name, user_id, version, lambda: json.dumps(build(), separators=(',', ':')).encode())
+
+
+def gzip_json_response(etag, load):
+    """
+    load()가 반환하는 gzip 압축 JSON으로 응답. ETag가 일치하면 load 없이 304를 반환하고,
+    클라이언트가 gzip을 지원하면 압축된 바이트를 다시 압축하지 않고 그대로 전송한다.
+    etag가 None이면(버전을 추적할 수 없는 경우) 조건부 요청을 처리하지 않는다.
+    """
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = current_app.response_class(load(), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(gzip.decompress(load()), mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,344 @@
+# 📄 instrumentation.py
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'perf_metrics'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 한 요청에서 같은 SQL(파라미터 제외)이 이 횟수 이상 실행되면 N+1 패턴으로 판단
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+# 캐시 조회(GET/MGET)로 집계하는 Redis 명령
+CACHE_LOOKUP_COMMANDS = {'GET', 'MGET'}
+
+METRIC_DEFINITIONS = {
+    'wealth_tracker_http_requests_total': ('counter', '라우트/메서드/상태 코드별 요청 수'),
+    'wealth_tracker_http_request_duration_seconds': ('histogram', '라우트별 요청 처리 시간'),
+    'wealth_tracker_db_queries_total': ('counter', '라우트별 SQL 실행 횟수'),
+    'wealth_tracker_db_query_seconds_total': ('counter', '라우트별 SQL 실행 시간 합계'),
+    'wealth_tracker_redis_commands_total': ('counter', '라우트별 Redis 왕복 횟수 (파이프라인은 1회)'),
+    'wealth_tracker_redis_seconds_total': ('counter', '라우트별 Redis 호출 시간 합계'),
+    'wealth_tracker_cache_lookups_total': ('counter', '키 접두사별 Redis 캐시 조회 결과 (hit/miss)'),
+    'wealth_tracker_upstream_calls_total': ('counter', '외부 시세 API 호출 횟수'),
+    'wealth_tracker_upstream_seconds_total': ('counter', '외부 시세 API 호출 시간 합계'),
+    'wealth_tracker_n_plus_one_total': ('counter', 'PERF_DEBUG 모드에서 감지된 N+1 쿼리 패턴 수'),
+    # 아래는 Redis에 합산하지 않는 프로세스별 지표 (스크레이프를 처리한 워커의 pid 레이블)
+    'wealth_tracker_local_cache_entries': ('gauge', '프로세스 내 L1 캐시 항목 수'),
+    'wealth_tracker_local_cache_bytes': ('gauge', '프로세스 내 L1 캐시 크기 (바이트)'),
+    'wealth_tracker_local_cache_lookups_total': ('counter', '프로세스 내 L1 캐시 조회 결과 (hit/miss)'),
+    'wealth_tracker_local_cache_evictions_total': ('counter', '용량 초과로 제거된 L1 캐시 항목 수'),
+}
+
+_PARAM_LIST_RE = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,?)+\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_statement(statement):
+    """파라미터 개수만 다른 같은 쿼리(IN 목록 등)를 하나로 묶기 위해 SQL 문을 정규화."""
+    return _PARAM_LIST_RE.sub('(?)', _WHITESPACE_RE.sub(' ', statement)).strip()
+
+
+def _key_prefix(key):
+    if isinstance(key, bytes):
+        key = key.decode(errors='replace')
+    return str(key).split(':', 1)[0]
+
+
+class RequestStats:
+    """요청 하나 동안의 DB/Redis/업스트림 호출 횟수와 시간."""
+
+    def __init__(self, track_statements=False):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+        self.cache_lookups = Counter()
+        self.upstream_calls = Counter()
+        self.upstream_time = defaultdict(float)
+        self.statements = Counter() if track_statements else None
+
+    def record_cache_lookup(self, args, result):
+        command = str(args[0]).upper() if args else ''
+        if command == 'GET':
+            self.cache_lookups[(_key_prefix(args[1]), 'hit' if result is not None else 'miss')] += 1
+        elif command == 'MGET' and isinstance(result, (list, tuple)):
+            for key, value in zip(args[1:], result):
+                self.cache_lookups[(_key_prefix(key), 'hit' if value is not None else 'miss')] += 1
+
+    def record_local_hits(self, keys):
+        """Redis까지 가지 않고 프로세스 내 L1 캐시에서 찾은 키."""
+        for key in keys:
+            self.cache_lookups[(_key_prefix(key), 'local_hit')] += 1
+
+    def n_plus_one_patterns(self):
+        if not self.statements:
+            return []
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self, total):
+        """Server-Timing 헤더 값. 브라우저 개발자 도구의 Network > Timing 탭에 표시된다."""
+        local_hits = sum(n for (_, result), n in self.cache_lookups.items() if result == 'local_hit')
+        hits = local_hits + sum(n for (_, result), n in self.cache_lookups.items() if result == 'hit')
+        misses = sum(n for (_, result), n in self.cache_lookups.items() if result == 'miss')
+        upstream_time = sum(self.upstream_time.values())
+        parts = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'redis;dur={self.redis_time * 1000:.1f};desc="{self.redis_calls} calls"',
+            f'cache;desc="{hits} hit ({local_hits} local) / {misses} miss"',
+            f'upstream;dur={upstream_time * 1000:.1f};desc="{sum(self.upstream_calls.values())} calls"',
+            f'app;dur={total * 1000:.1f}',
+        ]
+        patterns = self.n_plus_one_patterns()
+        if patterns:
+            parts.append(f'nplusone;desc="{len(patterns)} patterns"')
+        return ', '.join(parts)
+
+
+def current_stats():
+    if not has_app_context():
+        return None
+    return g.get('perf_stats')
+
+
+def record_upstream(source, seconds, calls=1):
+    """
+    현재 요청에 업스트림 호출 calls회와 소요 시간을 기록. 요청 컨텍스트가 없는 스레드 풀에서 병렬로 호출한 경우
+    요청 스레드에서 전체 경과 시간과 호출 수를 한 번에 기록하는 데 사용한다.
+    """
+    stats = current_stats()
+    if stats is not None:
+        stats.upstream_calls[source] += calls
+        stats.upstream_time[source] += seconds
+
+
+@contextmanager
+def track_upstream(source):
+    """외부 API(yfinance 등) 호출 구간을 감싸 현재 요청의 업스트림 호출 횟수와 시간을 기록."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_upstream(source, time.perf_counter() - start)
+
+
+def instrument_redis(client):
+    """
+    Redis 클라이언트 인스턴스의 명령 실행과 파이프라인 실행을 감싸 요청별 호출 횟수/시간과
+    키 접두사별 캐시 적중 여부를 기록. 요청 밖(워커, 스트리밍 리스너)에서는 그대로 통과한다.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def timed_execute_command(*args, **options):
+        stats = current_stats()
+        if stats is None:
+            return execute_command(*args, **options)
+        start = time.perf_counter()
+        try:
+            result = execute_command(*args, **options)
+        finally:
+            stats.redis_calls += 1
+            stats.redis_time += time.perf_counter() - start
+        if args and str(args[0]).upper() in CACHE_LOOKUP_COMMANDS:
+            stats.record_cache_lookup(args, result)
+        return result
+
+    def instrumented_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*exec_args, **exec_kwargs):
+            stats = current_stats()
+            if stats is None:
+                return execute(*exec_args, **exec_kwargs)
+            start = time.perf_counter()
+            try:
+                return execute(*exec_args, **exec_kwargs)
+            finally:
+                stats.redis_calls += 1
+                stats.redis_time += time.perf_counter() - start
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = instrumented_pipeline
+    return client
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    starts = conn.info.get('perf_query_start')
+    if stats is None or not starts:
+        return
+    stats.db_queries += 1
+    stats.db_time += time.perf_counter() - starts.pop()
+    if stats.statements is not None:
+        stats.statements[normalize_statement(statement)] += 1
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    Prometheus 텍스트 형식으로 노출할 누적 지표.
+    gunicorn 워커가 여러 개여도 한 번에 집계되도록 Redis 해시 하나에 저장하며,
+    Redis가 없거나 명령이 실패하면 프로세스 메모리에 저장한다.
+    Redis 명령은 store(TieredCache)의 redis_call()로 실행하여 캐시와 같은 장애 감지/재시도 대기를 공유하므로,
+    장애 중에는 요청마다 연결 타임아웃을 기다리지 않는다. store는 cache 모듈이 market_cache로 설정한다.
+    """
+
+    def __init__(self, store=None, key=METRICS_KEY):
+        self.store = store
+        self.key = key
+        self._local = defaultdict(float)
+        self._lock = threading.Lock()
+        self._process_collectors = []
+
+    def add_process_collector(self, collector):
+        """collector()가 반환하는 [(지표 이름, 레이블 dict, 값), ...]을 합산 없이 현재 프로세스 값으로 노출."""
+        self._process_collectors.append(collector)
+
+    @staticmethod
+    def _field(name, labels):
+        return json.dumps([name, sorted(labels.items())], ensure_ascii=False)
+
+    def increment(self, samples):
+        """samples: [(지표 이름, 레이블 dict, 증가량), ...]을 한 번의 파이프라인으로 누적."""
+        def write(redis_client):
+            pipe = redis_client.pipeline(transaction=False)
+            for name, labels, amount in samples:
+                pipe.hincrbyfloat(self.key, self._field(name, labels), amount)
+            pipe.execute()
+            return True
+
+        if self.store is not None and self.store.redis_call(write, default=False):
+            return
+        # Redis 장애 중에는 프로세스 메모리에 누적 (/metrics도 이 값을 노출)
+        with self._lock:
+            for name, labels, amount in samples:
+                self._local[self._field(name, labels)] += amount
+
+    def record_request(self, route, method, status, duration, stats):
+        samples = [
+            ('wealth_tracker_http_requests_total', {'route': route, 'method': method, 'status': str(status)}, 1),
+            ('wealth_tracker_http_request_duration_seconds_sum', {'route': route}, duration),
+            ('wealth_tracker_http_request_duration_seconds_count', {'route': route}, 1),
+            ('wealth_tracker_db_queries_total', {'route': route}, stats.db_queries),
+            ('wealth_tracker_db_query_seconds_total', {'route': route}, stats.db_time),
+            ('wealth_tracker_redis_commands_total', {'route': route}, stats.redis_calls),
+            ('wealth_tracker_redis_seconds_total', {'route': route}, stats.redis_time),
+        ]
+        # 히스토그램 버킷은 누적 값으로 저장 (duration 이상인 모든 버킷과 +Inf 증가)
+        samples += [('wealth_tracker_http_request_duration_seconds_bucket', {'route': route, 'le': _format_value(le)}, 1)
+                    for le in LATENCY_BUCKETS if duration <= le]
+        samples.append(('wealth_tracker_http_request_duration_seconds_bucket', {'route': route, 'le': '+Inf'}, 1))
+        samples += [('wealth_tracker_cache_lookups_total', {'prefix': prefix, 'result': result}, n)
+                    for (prefix, result), n in stats.cache_lookups.items()]
+        for source, n in stats.upstream_calls.items():
+            samples.append(('wealth_tracker_upstream_calls_total', {'source': source}, n))
+            samples.append(('wealth_tracker_upstream_seconds_total', {'source': source}, stats.upstream_time[source]))
+        patterns = stats.n_plus_one_patterns()
+        if patterns:
+            samples.append(('wealth_tracker_n_plus_one_total', {'route': route}, len(patterns)))
+        self.increment(samples)
+
+    def _load(self):
+        raw = self.store.redis_call(lambda r: r.hgetall(self.key)) if self.store is not None else None
+        if raw is not None:
+            return {(k.decode() if isinstance(k, bytes) else k): float(v) for k, v in raw.items()}
+        # Redis 장애 중에는 프로세스 메모리의 지표만 노출
+        with self._lock:
+            return dict(self._local)
+
+    def render(self):
+        """Prometheus 텍스트 노출 형식(text/plain; version=0.0.4)으로 변환."""
+        families = defaultdict(list)
+        for field, value in self._load().items():
+            name, labels = json.loads(field)
+            labels = dict(labels)
+            family = next((f for f in METRIC_DEFINITIONS if name == f or name.startswith(f + '_')), name)
+            families[family].append((name, labels, value))
+        for collector in self._process_collectors:
+            for name, labels, value in collector():
+                families[name].append((name, dict(labels, pid=str(os.getpid())), value))
+
+        def sort_key(sample):
+            name, labels, _ = sample
+            le = labels.get('le')
+            bucket_order = float('inf') if le == '+Inf' else float(le) if le else 0
+            return (name, sorted((k, v) for k, v in labels.items() if k != 'le'), bucket_order)
+
+        lines = []
+        for family in sorted(families):
+            metric_type, description = METRIC_DEFINITIONS.get(family, ('untyped', ''))
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            for name, labels, value in sorted(families[family], key=sort_key):
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def init_instrumentation(app, redis_client=None):
+    """
+    요청별 계측 훅을 등록. SQLAlchemy 쿼리, Redis 명령, 외부 API 호출 합계를 Server-Timing 헤더로 내보내고
+    라우트별 누적 지표를 metrics_registry에 기록한다.
+    PERF_DEBUG가 켜져 있으면 요청마다 N+1 쿼리 패턴을 찾아 경고 로그를 남긴다.
+    """
+    app.config.setdefault('PERF_DEBUG', os.environ.get('PERF_DEBUG', '').lower() in ('1', 'true', 'yes'))
+    if redis_client is not None:
+        instrument_redis(redis_client)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_stats():
+        if request.endpoint != 'static':
+            g.perf_stats = RequestStats(track_statements=app.config['PERF_DEBUG'])
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.pop('perf_stats', None)
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats.started
+        response.headers['Server-Timing'] = stats.server_timing(duration)
+
+        for statement, count in stats.n_plus_one_patterns():
+            logger.warning(f"N+1 쿼리 의심 ({request.method} {request.path}): {count}회 실행 - {statement[:300]}")
+
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        try:
+            metrics_registry.record_request(route, request.method, response.status_code, duration, stats)
+        except Exception as e:
+            logger.error(f"요청 지표 기록 실패: {e}")
+        return response
@@ -1,6 +1,8 @@
 # 📄 models.py
 
 from datetime import datetime
+from collections import deque
+from itertools import groupby
 from sqlalchemy import func, extract
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -26,6 +28,9 @@ class Trade(db.Model):
     trade_date = db.Column(db.Date, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
+    # 거래 기록 키셋 페이지네이션((trade_date, id) 기준 정렬/탐색)용 복합 인덱스
+    __table_args__ = (db.Index('ix_trade_user_date_id', 'user_id', 'trade_date', 'id'),)
+
 class Holding(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     symbol = db.Column(db.String(20), nullable=False, index=True)
@@ -47,7 +52,11 @@ class Dividend(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
     # 동일한 사용자의 동일 종목, 동일 배당락일 배당이 중복 저장되지 않도록 제약조건 추가 (선택사항)
-    __table_args__ = (db.UniqueConstraint('user_id', 'symbol', 'ex_dividend_date', name='_user_symbol_ex_date_uc'),)
+    # 배당 내역 키셋 페이지네이션((dividend_date, id) 기준 정렬/탐색)용 복합 인덱스 추가
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'symbol', 'ex_dividend_date', name='_user_symbol_ex_date_uc'),
+        db.Index('ix_dividend_user_date_id', 'user_id', 'dividend_date', 'id'),
+    )
 
 
 class StockPrice(db.Model):
@@ -58,32 +67,140 @@ class StockPrice(db.Model):
     change_percent = db.Column(db.Float, default=0.0)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
+class PriceHistory(db.Model):
+    """종목별 일별 종가 기록. 리스크 분석의 수익률 행렬 계산에 사용."""
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('symbol', 'date', name='_symbol_date_uc'),)
+
 class DividendUpdateCache(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-def recalculate_holdings(user_id):
-    Holding.query.filter_by(user_id=user_id).delete()
-    symbols = db.session.query(Trade.symbol).filter_by(user_id=user_id).distinct().all()
-    for (symbol,) in symbols:
-        trades = Trade.query.filter_by(symbol=symbol, user_id=user_id).order_by(Trade.trade_date, Trade.id).all()
-        buy_queue = []
-        for trade in trades:
+# 보유 기간이 이보다 길면 장기 보유로 분류
+LONG_TERM_HOLDING_DAYS = 365
+# 수량 비교 시 부동소수 오차 허용치
+QUANTITY_EPSILON = 1e-9
+
+class TaxLot(db.Model):
+    """
+    FIFO 매수 lot. 매수 거래 하나가 lot 하나가 되며, 매도로 앞선 lot부터 소진된다.
+    remaining_quantity > 0이면 보유 중인 lot이고, 보유 종목(Holding)은 보유 중인 lot의 합계다.
+    trade_id는 거래 삭제 순서와 무관하도록 외래 키 없이 원래 매수 거래 id만 기록한다.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    symbol = db.Column(db.String(20), nullable=False)
+    trade_id = db.Column(db.Integer, nullable=False)
+    acquired_date = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    remaining_quantity = db.Column(db.Float, nullable=False)
+    cost_per_share = db.Column(db.Float, nullable=False)
+
+    # 종목별 보유 lot 조회용
+    __table_args__ = (db.Index('ix_tax_lot_user_symbol_date', 'user_id', 'symbol', 'acquired_date', 'id'),)
+
+class LotRealization(db.Model):
+    """매도 거래가 lot 하나를 소진한 기록. 매도 하나가 여러 lot에 걸치면 lot마다 한 행씩 생긴다."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    symbol = db.Column(db.String(20), nullable=False)
+    lot_id = db.Column(db.Integer, db.ForeignKey('tax_lot.id', ondelete='CASCADE'), nullable=False, index=True)
+    trade_id = db.Column(db.Integer, nullable=False)
+    acquired_date = db.Column(db.Date, nullable=False)
+    sold_date = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    cost_basis = db.Column(db.Float, nullable=False)
+    proceeds = db.Column(db.Float, nullable=False)
+    realized_gain = db.Column(db.Float, nullable=False)
+    holding_days = db.Column(db.Integer, nullable=False)
+
+    # 실현 손익 내역 키셋 페이지네이션((sold_date, id) 기준) 및 연도별 집계용
+    __table_args__ = (db.Index('ix_lot_realization_user_sold_id', 'user_id', 'sold_date', 'id'),)
+
+    @property
+    def is_long_term(self):
+        return self.holding_days > LONG_TERM_HOLDING_DAYS
+
+class UnmatchedSellError(ValueError):
+    """매도 수량이 그 시점까지 남은 매수 lot을 초과함. 실현 내역을 만들 수 없으므로 재계산을 취소한다."""
+
+    def __init__(self, trade, unmatched_quantity):
+        self.trade_id = trade.id
+        self.unmatched_quantity = unmatched_quantity
+        super().__init__(f"{trade.trade_date} {trade.symbol} 매도 수량({trade.quantity:g})이 그 시점의 보유 수량을 {unmatched_quantity:g}주 초과합니다.")
+
+def recalculate_holdings(user_id, symbols=None, clamp_unmatched=False):
+    """
+    사용자의 거래를 FIFO로 재생하여 lot 원장(TaxLot, LotRealization)과 보유 종목(Holding)을 다시 계산.
+    거래를 한 번의 쿼리로 (종목, 거래일, id) 순서로 읽어 종목별로 처리한다.
+    symbols를 주면 해당 종목만 다시 계산한다 (거래 한 건 추가/삭제 시 다른 종목의 lot은 바뀌지 않음).
+    남은 lot으로 채울 수 없는 매도가 있으면 아무것도 쓰지 않고 UnmatchedSellError를 발생시키며,
+    호출하는 쪽에서 세션을 rollback해야 한다.
+    clamp_unmatched면 예외 대신 채울 수 있는 수량까지만 실현 처리하고 계속 진행한다 (기존 데이터 일괄 재계산용).
+    이때 초과 매도 목록 [(trade_id, symbol, 초과 수량), ...]을 반환하며, 초과분은 실현 손익에 포함되지 않는다.
+    """
+    def scoped(query, model):
+        query = query.filter(model.user_id == user_id)
+        return query.filter(model.symbol.in_(symbols)) if symbols is not None else query
+
+    scoped(LotRealization.query, LotRealization).delete(synchronize_session=False)
+    scoped(TaxLot.query, TaxLot).delete(synchronize_session=False)
+    scoped(Holding.query, Holding).delete(synchronize_session=False)
+    trades = scoped(db.session.query(Trade.id, Trade.symbol, Trade.trade_type, Trade.quantity, Trade.price, Trade.trade_date), Trade).order_by(
+        Trade.symbol, Trade.trade_date, Trade.id
+    ).all()
+
+    lots, realizations, holdings, unmatched = [], [], [], []
+    for symbol, symbol_trades in groupby(trades, key=lambda t: t.symbol):
+        open_lots = deque()
+        for trade in symbol_trades:
             if trade.trade_type == 'buy':
-                buy_queue.append({'quantity': trade.quantity, 'price': trade.price, 'date': trade.trade_date})
+                lot = {'user_id': user_id, 'symbol': symbol, 'trade_id': trade.id, 'acquired_date': trade.trade_date,
+                       'quantity': trade.quantity, 'remaining_quantity': trade.quantity, 'cost_per_share': trade.price}
+                lots.append(lot); open_lots.append(lot)
             elif trade.trade_type == 'sell':
                 sell_quantity = trade.quantity
-                while sell_quantity > 0 and buy_queue:
-                    if buy_queue[0]['quantity'] <= sell_quantity:
-                        sell_quantity -= buy_queue[0]['quantity']; buy_queue.pop(0)
+                while sell_quantity > QUANTITY_EPSILON and open_lots:
+                    lot = open_lots[0]
+                    # 부동소수 오차로 남는 극소량(예: 0.1 + 0.2 매수 후 0.3 매도)은 lot을 전부 소진한 것으로 본다
+                    if lot['remaining_quantity'] <= sell_quantity + QUANTITY_EPSILON:
+                        used = lot['remaining_quantity']; open_lots.popleft()
+                        lot['remaining_quantity'] = 0.0
                     else:
-                        buy_queue[0]['quantity'] -= sell_quantity; sell_quantity = 0
-        final_quantity = sum(b['quantity'] for b in buy_queue)
-        if final_quantity > 0:
-            final_cost = sum(b['quantity'] * b['price'] for b in buy_queue)
+                        used = sell_quantity
+                        lot['remaining_quantity'] -= used
+                    sell_quantity -= used
+                    realizations.append((lot, {
+                        'user_id': user_id, 'symbol': symbol, 'trade_id': trade.id,
+                        'acquired_date': lot['acquired_date'], 'sold_date': trade.trade_date, 'quantity': used,
+                        'cost_basis': used * lot['cost_per_share'], 'proceeds': used * trade.price,
+                        'realized_gain': used * (trade.price - lot['cost_per_share']),
+                        'holding_days': (trade.trade_date - lot['acquired_date']).days,
+                    }))
+                if sell_quantity > QUANTITY_EPSILON:
+                    if not clamp_unmatched:
+                        raise UnmatchedSellError(trade, sell_quantity)
+                    logger.warning(f"User {user_id}: {symbol} 매도 거래 {trade.id}({trade.trade_date})가 보유 수량을 {sell_quantity:g}주 초과하여 초과분을 제외했습니다.")
+                    unmatched.append((trade.id, symbol, sell_quantity))
+        final_quantity = sum(lot['remaining_quantity'] for lot in open_lots)
+        if final_quantity > QUANTITY_EPSILON:
+            final_cost = sum(lot['remaining_quantity'] * lot['cost_per_share'] for lot in open_lots)
             avg_price = final_cost / final_quantity
-            latest_buy_date = max(b['date'] for b in buy_queue) if buy_queue else None
-            holding = Holding(symbol=symbol, quantity=final_quantity, purchase_price=avg_price, purchase_date=datetime.combine(latest_buy_date, datetime.min.time()) if latest_buy_date else None, user_id=user_id)
-            db.session.add(holding)
+            latest_buy_date = max(lot['acquired_date'] for lot in open_lots) if open_lots else None
+            holdings.append(Holding(symbol=symbol, quantity=final_quantity, purchase_price=avg_price, purchase_date=datetime.combine(latest_buy_date, datetime.min.time()) if latest_buy_date else None, user_id=user_id))
+
+    # 실현 기록에 lot id가 필요하다. RETURNING은 SQLite 등에서 행마다 INSERT로 풀리므로
+    # lot은 executemany 한 번으로 넣고, 매수 거래 하나당 lot 하나이므로 trade_id로 id를 다시 읽어 온다
+    if lots:
+        db.session.execute(TaxLot.__table__.insert(), lots)
+    if realizations:
+        lot_ids = dict(scoped(db.session.query(TaxLot.trade_id, TaxLot.id), TaxLot).all())
+        db.session.execute(LotRealization.__table__.insert(), [dict(row, lot_id=lot_ids[lot['trade_id']]) for lot, row in realizations])
+    db.session.add_all(holdings)
     db.session.commit()
+    return unmatched
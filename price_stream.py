@@ -0,0 +1,94 @@
+# 📄 price_stream.py
+
+import os
+import queue
+import logging
+import threading
+from pubsub_listener import pubsub_listener
+
+try:
+    from app import conn as redis_conn
+except ImportError:
+    redis_conn = None
+    logging.warning("Redis 연결을 가져오지 못했습니다. 실시간 시세 스트리밍이 비활성화됩니다.")
+
+logger = logging.getLogger(__name__)
+
+PRICE_UPDATES_CHANNEL = 'price_updates'
+# SSE 연결은 끝날 때까지 gthread 워커 스레드 하나를 점유하므로, 워커 스레드 수(WEB_THREADS, gunicorn --threads와 같은 값)에서
+# 일반 요청용 여유분을 뺀 만큼만 허용한다. 한도를 넘으면 503을 반환하여 클라이언트가 폴링으로 전환한다
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 32))
+STREAM_THREAD_HEADROOM = 8
+MAX_STREAM_CLIENTS = max(1, min(int(os.environ.get('MAX_PRICE_STREAM_CLIENTS', WEB_THREADS)), WEB_THREADS - STREAM_THREAD_HEADROOM))
+
+
+class PriceSubscription:
+    """SSE 연결 하나에 대응하는 구독. 관심 종목의 시세 변경만 큐로 전달받는다."""
+
+    def __init__(self, broadcaster, symbols):
+        self.broadcaster = broadcaster
+        self.symbols = set(symbols)
+        self.queue = queue.Queue(maxsize=100)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class PriceBroadcaster:
+    """
+    프로세스 공용 pub/sub 구독(PubSubListener)으로 시세 변경 이벤트를 받아,
+    연결된 모든 SSE 클라이언트에 관심 종목별로 분배(fan-out)한다.
+    """
+
+    def __init__(self, redis_client, channel=PRICE_UPDATES_CHANNEL, listener=pubsub_listener):
+        self.redis = redis_client
+        self.channel = channel
+        self.listener = listener
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        if redis_client is not None:
+            listener.register(channel, self._dispatch)
+
+    @property
+    def available(self):
+        # 구독 연결이 끊겨 재연결 중이면 이벤트를 받을 수 없으므로 클라이언트를 폴링으로 돌려보낸다
+        return self.redis is not None and not self.listener.failing
+
+    def subscribe(self, symbols):
+        """구독을 등록. 스트리밍을 사용할 수 없거나 연결 수가 한도를 넘으면 None."""
+        if not self.available:
+            return None
+        with self._lock:
+            if len(self._subscriptions) >= MAX_STREAM_CLIENTS:
+                return None
+            subscription = PriceSubscription(self, symbols)
+            self._subscriptions.add(subscription)
+        self.listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _dispatch(self, event):
+        prices = event.get('prices', {})
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            relevant = {s: p for s, p in prices.items() if s in subscription.symbols}
+            if not relevant:
+                continue
+            try:
+                subscription.queue.put_nowait({'version': event.get('version'), 'prices': relevant})
+            except queue.Full:
+                # 느린 클라이언트는 이벤트를 버리고, 재연결 시 델타 API로 따라잡는다
+                logger.warning("시세 스트림 큐가 가득 차 이벤트를 버립니다.")
+
+
+price_broadcaster = PriceBroadcaster(redis_conn)
@@ -0,0 +1,88 @@
+# 📄 pubsub_listener.py
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+
+try:
+    from app import conn as redis_conn
+except ImportError:
+    redis_conn = None
+    logging.warning("Redis 연결을 가져오지 못했습니다. pub/sub 구독이 비활성화됩니다.")
+
+logger = logging.getLogger(__name__)
+
+# 새로 등록된 채널을 구독하기 위해 메시지를 기다리는 최대 시간
+POLL_TIMEOUT_SECONDS = 1.0
+
+
+class PubSubListener:
+    """
+    프로세스당 하나의 Redis pub/sub 연결로 여러 채널을 구독하고, 채널별로 등록된 핸들러에 JSON 메시지를 전달.
+    시세 스트림(price_updates)과 L1 캐시 무효화(cache_invalidation)가 같은 구독 스레드를 공유한다.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._handlers = defaultdict(list)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # 구독 연결이 끊겨 재연결을 기다리는 중이면 True
+        self.failing = False
+
+    def register(self, channel, handler):
+        """channel로 발행된 메시지를 handler(event)로 전달. 실행 중인 구독에도 다음 폴링 때 반영된다."""
+        with self._lock:
+            self._handlers[channel].append(handler)
+
+    def start(self):
+        # gunicorn 워커 fork 이후에는 부모 프로세스의 스레드가 없으므로 pid 기준으로 다시 시작
+        if self.redis is None:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._listen, name='pubsub-listener', daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                subscribed = set()
+                while True:
+                    with self._lock:
+                        channels = set(self._handlers) - subscribed
+                    if channels:
+                        pubsub.subscribe(*channels)
+                        subscribed |= channels
+                        self.failing, backoff = False, 1
+                    message = pubsub.get_message(timeout=POLL_TIMEOUT_SECONDS)
+                    if message and message.get('type') == 'message':
+                        self._dispatch(message)
+            except Exception as e:
+                self.failing = True
+                logger.error(f"pub/sub 구독 오류, {backoff}초 후 재연결: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _dispatch(self, message):
+        channel = message['channel']
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        with self._lock:
+            handlers = list(self._handlers.get(channel, ()))
+        event = json.loads(message['data'])
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"pub/sub 메시지 처리 실패 ({channel}): {e}")
+
+
+pubsub_listener = PubSubListener(redis_conn)
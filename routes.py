@@ -1,14 +1,30 @@
 # 📄 routes.py
 
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
-from datetime import datetime
-from sqlalchemy import func
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, Response, stream_with_context
+import io
+import os
+import csv
+import json
+import time
+import uuid
+from datetime import datetime, date
+from types import SimpleNamespace
+from sqlalchemy import func, select, case, extract
 from app import db, task_queue
-from tasks import update_all_dividends_for_user
-from models import User, Holding, Dividend, Trade, recalculate_holdings
-from utils import get_dividend_allocation_data
-from stock_api import stock_api, US_STOCKS_LIST
-from services.portfolio_service import get_portfolio_analysis_data
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
+from redis.exceptions import RedisError
+from tasks import update_all_dividends_for_user, import_trades_job
+from models import User, Holding, Dividend, Trade, TaxLot, LotRealization, LONG_TERM_HOLDING_DAYS, QUANTITY_EPSILON, UnmatchedSellError, recalculate_holdings
+from utils import get_dividend_allocation_data, bump_portfolio_version, get_portfolio_version, keyset_paginate
+from stock_api import stock_api, search_us_stocks, PRICE_HISTORY_RANGES, DEFAULT_HISTORY_RANGE, DEFAULT_HISTORY_POINTS, MIN_HISTORY_POINTS, MAX_HISTORY_POINTS
+from price_stream import price_broadcaster
+from instrumentation import metrics_registry
+from fragment_cache import cached_fragment, cached_json, gzip_json_response
+from services.portfolio_service import get_portfolio_snapshot, get_snapshot_version, build_price_delta
+from services.risk_service import calculate_risk_metrics
+from services.market_data_loader import get_market_data_loader, PRICE, PROFILE
+from services.trade_import_service import import_trades, TradeImportError
 from flask_login import login_user, logout_user, current_user, login_required
 import logging
 
@@ -52,32 +68,77 @@ def signup():
 @main_bp.route('/')
 @login_required
 def dashboard():
-    portfolio_data = get_portfolio_analysis_data(current_user.id)
-    if not portfolio_data:
-        return render_template('dashboard.html', summary={}, sector_allocation=[], monthly_dividend_data={})
-    return render_template('dashboard.html', 
-                           summary=portfolio_data['summary'], 
-                           sector_allocation=portfolio_data['sector_allocation'], 
-                           monthly_dividend_data=portfolio_data['monthly_dividend_data'])
+    # 본문(요약 카드, 수익률, 차트 영역)은 스냅샷 버전별로 렌더링 결과를 캐시하고, 차트 데이터는 portfolio_chart_data에서 받는다
+    version = get_snapshot_version(current_user.id)
+
+    def render_body():
+        portfolio_data = get_portfolio_snapshot(current_user.id) or {}
+        return render_template('fragments/dashboard_body.html',
+                               summary=portfolio_data.get('summary', {}),
+                               sector_allocation=portfolio_data.get('sector_allocation', []))
+
+    return render_template('dashboard.html',
+                           body=cached_fragment('dashboard', current_user.id, version, render_body),
+                           has_portfolio=version is not None,
+                           price_version=stock_api.get_price_version())
 
 @main_bp.route('/dividends')
 @login_required
 def dividends():
-    portfolio_data = get_portfolio_analysis_data(current_user.id)
-    if not portfolio_data:
-        return render_template('dividends.html', dividend_metrics={}, allocation_data=[], monthly_dividend_data={})
-    
-    # 🛠️ 템플릿에 전달할 데이터 구조를 명확하게 분리
-    dividend_metrics = portfolio_data['dividend_metrics']
-    allocation_data = get_dividend_allocation_data(dividend_metrics)
-    monthly_dividend_data = portfolio_data['monthly_dividend_data']
-    total_annual_dividend = sum(m.get('expected_annual_dividend', 0) for m in dividend_metrics.values())
-
-    return render_template('dividends.html',
-                           dividend_metrics=dividend_metrics,
-                           allocation_data=allocation_data,
-                           monthly_dividend_data=monthly_dividend_data,
-                           total_annual_dividend=total_annual_dividend)
+    version = get_snapshot_version(current_user.id)
+
+    def render_body():
+        portfolio_data = get_portfolio_snapshot(current_user.id)
+        if not portfolio_data:
+            return render_template('fragments/dividends_body.html', dividend_metrics={})
+        dividend_metrics = portfolio_data['dividend_metrics']
+        total_annual_dividend = sum(m.get('expected_annual_dividend', 0) for m in dividend_metrics.values())
+        return render_template('fragments/dividends_body.html',
+                               dividend_metrics=dividend_metrics,
+                               allocation_data=get_dividend_allocation_data(dividend_metrics),
+                               total_annual_dividend=total_annual_dividend)
+
+    return render_template('dividends.html', body=cached_fragment('dividends', current_user.id, version, render_body))
+
+def _dashboard_chart_data(snapshot):
+    monthly = snapshot['monthly_dividend_data']
+    # 대시보드 월별 차트는 월 합계만 사용하므로 종목별 상세 내역은 보내지 않는다
+    return {'sector_allocation': snapshot['sector_allocation'],
+            'monthly_dividend_data': {'labels': monthly['labels'], 'datasets': monthly['datasets']}}
+
+def _dividends_chart_data(snapshot):
+    monthly = snapshot['monthly_dividend_data']
+    # 월별 상세 내역에는 화면에 표시하는 프로필 필드(회사명, 로고)만 남긴다
+    detailed_data = {
+        month: [dict(item, profile={'name': (item.get('profile') or {}).get('name'), 'logo_url': (item.get('profile') or {}).get('logo_url')})
+                for item in items]
+        for month, items in monthly['detailed_data'].items()
+    }
+    return {'allocation_data': get_dividend_allocation_data(snapshot['dividend_metrics']),
+            'monthly_dividend_data': dict(monthly, detailed_data=detailed_data)}
+
+CHART_DATA_BUILDERS = {'dashboard': _dashboard_chart_data, 'dividends': _dividends_chart_data}
+
+@main_bp.route('/api/portfolio/charts/<name>')
+@login_required
+def portfolio_chart_data(name):
+    """
+    대시보드/배당 페이지 차트 데이터. 스냅샷 버전별로 직렬화·gzip 압축한 JSON을 캐시해 그대로 전송하며,
+    ETag(스냅샷 버전)가 일치하면 본문 없이 304를 반환한다.
+    """
+    build = CHART_DATA_BUILDERS.get(name)
+    if build is None:
+        return jsonify({'error': 'unknown chart'}), 404
+    version = get_snapshot_version(current_user.id)
+
+    def build_chart_data():
+        snapshot = get_portfolio_snapshot(current_user.id)
+        return build(snapshot) if snapshot else {}
+
+    # Redis 장애 중에는 버전이 바뀌지 않으므로 ETag를 보내지 않는다
+    etag = f"{current_user.id}-{name}-{version}" if stock_api.versions_available else None
+    return gzip_json_response(etag,
+                              lambda: cached_json(f"charts:{name}", current_user.id, version, build_chart_data))
 
 @main_bp.route('/holdings')
 @login_required
@@ -86,8 +147,9 @@ def holdings():
     if not holdings: return render_template('holdings.html', holdings_data=[])
     
     symbols = {h.symbol for h in holdings}
-    price_data_map = {s: stock_api.get_stock_price(s) for s in symbols}
-    profile_data_map = {s: stock_api.get_stock_profile(s) for s in symbols}
+    loader = get_market_data_loader().require(symbols, (PRICE, PROFILE))
+    price_data_map = loader.prices(symbols)
+    profile_data_map = loader.profiles(symbols)
     
     holdings_data = []
     for h in holdings:
@@ -108,14 +170,51 @@ def holdings():
             'profit_loss': profit_loss,
             'profit_loss_percent': profit_loss_percent,
         })
-    return render_template('holdings.html', holdings_data=holdings_data)
+    return render_template('holdings.html', holdings_data=holdings_data, price_version=stock_api.get_price_version())
+
+TRADES_PER_PAGE = 50
+DIVIDENDS_PER_PAGE = 20
+EXPORT_BATCH_SIZE = 1000
+
+def _stream_csv(header, statement):
+    """
+    서버 사이드 커서(yield_per)로 EXPORT_BATCH_SIZE 행씩 읽어 CSV 텍스트로 내보내는 제너레이터.
+    전체 결과를 메모리에 올리지 않으므로 내역 길이와 무관하게 메모리 사용량이 일정하다.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for partition in result.partitions():
+        buffer.seek(0); buffer.truncate()
+        writer.writerows(partition)
+        yield buffer.getvalue()
+
+def _csv_response(rows, filename):
+    return Response(stream_with_context(rows), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
-# ... (trades, etc. routes are unchanged) ...
 @main_bp.route('/trades')
 @login_required
 def trades():
-    trades = Trade.query.filter_by(user_id=current_user.id).order_by(Trade.trade_date.desc(), Trade.id.desc()).all()
-    return render_template('trades.html', trades=trades)
+    symbol = request.args.get('symbol', '').upper().strip()
+    query = Trade.query.filter_by(user_id=current_user.id)
+    if symbol:
+        query = query.filter(Trade.symbol == symbol)
+    trades_page = keyset_paginate(query, Trade.trade_date, Trade.id,
+                                  after=request.args.get('after'), before=request.args.get('before'), per_page=TRADES_PER_PAGE)
+    return render_template('trades.html', trades=trades_page.items, trades_page=trades_page, symbol_filter=symbol)
+
+@main_bp.route('/trades/export.csv')
+@login_required
+def export_trades():
+    # 열 구성은 CSV 가져오기 형식과 같아, 내보낸 파일을 그대로 다시 가져올 수 있다
+    statement = select(Trade.trade_date, Trade.symbol, Trade.trade_type, Trade.quantity, Trade.price).where(
+        Trade.user_id == current_user.id
+    ).order_by(Trade.trade_date, Trade.id)
+    rows = _stream_csv(['Date', 'Symbol', 'Action', 'Quantity', 'Price'], statement)
+    return _csv_response(rows, f"trades_{datetime.now():%Y%m%d}.csv")
 
 @main_bp.route('/trades/add', methods=['POST'])
 @login_required
@@ -126,13 +225,17 @@ def add_trade():
         trade_date = datetime.strptime(request.form.get('trade_date'), '%Y-%m-%d').date()
         if not all([symbol, trade_type, quantity > 0, price > 0]): raise ValueError("모든 필드를 올바르게 입력해주세요.")
         if trade_type == 'sell':
-            holding = Holding.query.filter_by(user_id=current_user.id, symbol=symbol).first()
-            if not holding or holding.quantity < quantity:
-                flash(f'보유 수량이 부족하여 매도할 수 없습니다. (보유: {holding.quantity if holding else 0})', 'error')
+            # Holding 객체를 세션에 올리지 않도록 수량만 조회 (재계산이 같은 트랜잭션에서 Holding 행을 다시 만든다)
+            held = db.session.query(Holding.quantity).filter_by(user_id=current_user.id, symbol=symbol).scalar() or 0
+            # 부동소수 오차로 보유 수량이 매도 수량보다 극소량 작아도 전량 매도로 허용 (FIFO 매칭과 같은 허용치)
+            if held + QUANTITY_EPSILON < quantity:
+                flash(f'보유 수량이 부족하여 매도할 수 없습니다. (보유: {held})', 'error')
                 return redirect(url_for('main.trades'))
         trade = Trade(symbol=symbol, trade_type=trade_type, quantity=quantity, price=price, trade_date=trade_date, user_id=current_user.id)
-        db.session.add(trade); db.session.commit()
-        recalculate_holdings(current_user.id)
+        # recalculate_holdings의 commit이 거래 추가와 lot 재계산을 함께 확정 (과거 날짜 매도가 lot을 초과하면 함께 취소)
+        db.session.add(trade); db.session.flush()
+        recalculate_holdings(current_user.id, symbols=[symbol])
+        bump_portfolio_version(current_user.id)
         flash(f'{symbol} {trade_type.upper()} 거래가 성공적으로 추가되었습니다.', 'success')
     except (ValueError, TypeError) as e:
         flash(str(e) or '수량, 가격, 날짜를 올바른 형식으로 입력해주세요.', 'error'); db.session.rollback()
@@ -144,52 +247,301 @@ def add_trade():
 @login_required
 def delete_trade(trade_id):
     trade = Trade.query.filter_by(id=trade_id, user_id=current_user.id).first_or_404()
-    db.session.delete(trade); db.session.commit()
-    recalculate_holdings(current_user.id)
-    flash(f'{trade.symbol} 거래가 삭제되었습니다.', 'success')
+    symbol = trade.symbol
+    try:
+        db.session.delete(trade); db.session.flush()
+        recalculate_holdings(current_user.id, symbols=[symbol])
+    except UnmatchedSellError as e:
+        db.session.rollback()
+        flash(f'이 매수 거래를 삭제하면 이후 매도를 채울 수 없어 삭제하지 않았습니다. {e}', 'error')
+        return redirect(url_for('main.trades'))
+    bump_portfolio_version(current_user.id)
+    flash(f'{symbol} 거래가 삭제되었습니다.', 'success')
     return redirect(url_for('main.trades'))
 
+def _refresh_dividends_after_import(user_id, rebuild_since):
+    """가져온 종목의 배당 기록을 다시 계산. 작업 큐를 사용할 수 없으면 요청 안에서 실행한다."""
+    if task_queue:
+        try:
+            task_queue.enqueue(update_all_dividends_for_user, user_id, force=True, rebuild_since=rebuild_since, job_timeout='10m')
+            return
+        except RedisError as e:
+            logger.error(f"배당 재계산 작업 등록 실패, 요청 안에서 실행합니다: {e}")
+    update_all_dividends_for_user(user_id, force=True, rebuild_since=rebuild_since)
+
+# 이보다 큰 업로드는 작업 큐가 있으면 백그라운드 작업으로 가져온다
+IMPORT_INLINE_MAX_BYTES = 512 * 1024
+IMPORT_UPLOAD_TTL_SECONDS = 3600
+
+@main_bp.route('/trades/import', methods=['POST'])
+@login_required
+def import_trades_csv():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('가져올 CSV 파일을 선택해주세요.', 'error')
+        return redirect(url_for('main.trades'))
+    skip_duplicates = bool(request.form.get('skip_duplicates'))
+
+    if task_queue and (request.content_length or 0) > IMPORT_INLINE_MAX_BYTES:
+        # 업로드를 청크 단위로 Redis에 옮겨 담고 워커가 이어서 스트리밍 처리
+        redis_client = task_queue.connection
+        upload_key = f"trade_import:{uuid.uuid4().hex}"
+        try:
+            for chunk in iter(lambda: upload.stream.read(64 * 1024), b''):
+                redis_client.append(upload_key, chunk)
+            redis_client.expire(upload_key, IMPORT_UPLOAD_TTL_SECONDS)
+            job = task_queue.enqueue(import_trades_job, current_user.id, upload_key, skip_duplicates,
+                                     job_timeout='30m', result_ttl=IMPORT_UPLOAD_TTL_SECONDS, meta={'user_id': current_user.id})
+            flash('파일이 커서 백그라운드에서 가져오는 중입니다. 완료되면 거래 기록에 반영됩니다.', 'info')
+            return redirect(url_for('main.trades', import_job=job.id))
+        except RedisError as e:
+            # 작업 큐를 사용할 수 없으면 업로드를 처음부터 다시 읽어 요청 안에서 가져온다
+            logger.error(f"거래 가져오기 작업 등록 실패, 요청 안에서 가져옵니다: {e}")
+            upload.stream.seek(0)
+
+    try:
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        result = import_trades(current_user.id, lines, skip_duplicates=skip_duplicates)
+    except TradeImportError as e:
+        flash(f"거래 내역을 가져오지 못했습니다 (오류 {len(e.errors)}건): " + ' / '.join(e.errors[:5]), 'error')
+        return redirect(url_for('main.trades'))
+    except UnicodeDecodeError:
+        flash('UTF-8로 저장된 CSV 파일만 가져올 수 있습니다.', 'error')
+        return redirect(url_for('main.trades'))
+    except Exception as e:
+        logger.error(f"거래 가져오기 오류: {e}"); flash('거래 내역을 가져오는 중 오류가 발생했습니다.', 'error')
+        return redirect(url_for('main.trades'))
+
+    if result['imported']:
+        _refresh_dividends_after_import(current_user.id, result['rebuild_since'])
+    flash(f"거래 {result['imported']}건을 가져왔습니다." + (f" (중복 {result['skipped_duplicates']}건 제외)" if result['skipped_duplicates'] else ''), 'success')
+    return redirect(url_for('main.trades'))
+
+@main_bp.route('/trades/import/status/<job_id>')
+@login_required
+def import_trades_status(job_id):
+    if not task_queue:
+        return jsonify({'error': '작업 큐를 사용할 수 없습니다.'}), 404
+    try:
+        job = Job.fetch(job_id, connection=task_queue.connection)
+    except NoSuchJobError:
+        return jsonify({'error': '가져오기 작업을 찾을 수 없습니다.'}), 404
+    if job.meta.get('user_id') != current_user.id:
+        return jsonify({'error': '가져오기 작업을 찾을 수 없습니다.'}), 404
+
+    status = job.get_status()
+    return jsonify({
+        'status': getattr(status, 'value', status),
+        'stage': job.meta.get('stage'),
+        'processed': job.meta.get('processed', 0),
+        'total': job.meta.get('total'),
+        'result': job.return_value() if job.is_finished else None,
+    })
+
 @main_bp.route('/dividends/history')
 @login_required
 def dividends_history():
     if task_queue:
-        task_queue.enqueue(update_all_dividends_for_user, current_user.id, job_timeout='10m')
-    page = request.args.get('page', 1, type=int)
-    dividends_pagination = Dividend.query.filter_by(user_id=current_user.id).order_by(Dividend.dividend_date.desc()).paginate(page=page, per_page=20, error_out=False)
+        try:
+            task_queue.enqueue(update_all_dividends_for_user, current_user.id, job_timeout='10m')
+        except RedisError as e:
+            logger.error(f"배당 갱신 작업 등록 실패: {e}")
+    dividends_page = keyset_paginate(Dividend.query.filter_by(user_id=current_user.id), Dividend.dividend_date, Dividend.id,
+                                     after=request.args.get('after'), before=request.args.get('before'), per_page=DIVIDENDS_PER_PAGE)
     total_received = db.session.query(func.sum(Dividend.amount)).filter_by(user_id=current_user.id).scalar() or 0
     return render_template('dividends_history.html', 
-                           dividends_pagination=dividends_pagination,
+                           dividends_page=dividends_page,
                            total_received=total_received)
 
+@main_bp.route('/dividends/export.csv')
+@login_required
+def export_dividends():
+    statement = select(Dividend.symbol, Dividend.ex_dividend_date, Dividend.dividend_date, Dividend.amount_per_share, Dividend.amount).where(
+        Dividend.user_id == current_user.id
+    ).order_by(Dividend.dividend_date, Dividend.id)
+    rows = _stream_csv(['Symbol', 'Ex-Dividend Date', 'Pay Date', 'Amount Per Share', 'Amount'], statement)
+    return _csv_response(rows, f"dividends_{datetime.now():%Y%m%d}.csv")
+
+@main_bp.route('/holdings/<string:symbol>/lots')
+@login_required
+def holding_lots(symbol):
+    """보유 종목의 lot별 취득일, 취득가, 미실현 손익. lot 원장을 인덱스로 조회하므로 거래를 재생하지 않는다."""
+    symbol = symbol.upper()
+    lots = TaxLot.query.filter(TaxLot.user_id == current_user.id, TaxLot.symbol == symbol, TaxLot.remaining_quantity > 0).order_by(
+        TaxLot.acquired_date, TaxLot.id
+    ).all()
+    if not lots:
+        flash(f'{symbol} 보유 lot이 없습니다.', 'error')
+        return redirect(url_for('main.holdings'))
+
+    loader = get_market_data_loader().require([symbol], (PRICE, PROFILE))
+    price_data = loader.price(symbol)
+    today = date.today()
+    lots_data = []
+    for lot in lots:
+        current_price = price_data['price'] if price_data else lot.cost_per_share
+        cost_basis = lot.remaining_quantity * lot.cost_per_share
+        unrealized_gain = lot.remaining_quantity * current_price - cost_basis
+        holding_days = (today - lot.acquired_date).days
+        lots_data.append({
+            'lot': lot,
+            'cost_basis': cost_basis,
+            'current_value': cost_basis + unrealized_gain,
+            'unrealized_gain': unrealized_gain,
+            'unrealized_percent': (unrealized_gain / cost_basis * 100) if cost_basis > 0 else 0,
+            'holding_days': holding_days,
+            'is_long_term': holding_days > LONG_TERM_HOLDING_DAYS,
+        })
+    realized_total = db.session.query(func.coalesce(func.sum(LotRealization.realized_gain), 0)).filter(
+        LotRealization.user_id == current_user.id, LotRealization.symbol == symbol
+    ).scalar()
+    return render_template('holding_lots.html', symbol=symbol, profile=loader.profile(symbol), price_data=price_data,
+                           lots_data=lots_data, realized_total=realized_total)
+
+REALIZATIONS_PER_PAGE = 50
+
+@main_bp.route('/realized-gains')
+@login_required
+def realized_gains():
+    # 연도별 단기/장기 실현 손익은 GROUP BY 한 번, 내역은 (sold_date, id) 키셋 페이지네이션
+    year = extract('year', LotRealization.sold_date)
+    long_term = LotRealization.holding_days > LONG_TERM_HOLDING_DAYS
+    yearly = db.session.query(
+        year.label('year'),
+        func.sum(case((long_term, 0), else_=LotRealization.realized_gain)).label('short_term'),
+        func.sum(case((long_term, LotRealization.realized_gain), else_=0)).label('long_term'),
+        func.sum(LotRealization.proceeds).label('proceeds'),
+        func.sum(LotRealization.cost_basis).label('cost_basis'),
+    ).filter(LotRealization.user_id == current_user.id).group_by(year).order_by(year.desc()).all()
+
+    query = LotRealization.query.filter_by(user_id=current_user.id)
+    symbol = request.args.get('symbol', '').upper().strip()
+    if symbol:
+        query = query.filter(LotRealization.symbol == symbol)
+    realizations_page = keyset_paginate(query, LotRealization.sold_date, LotRealization.id,
+                                        after=request.args.get('after'), before=request.args.get('before'), per_page=REALIZATIONS_PER_PAGE)
+    return render_template('realized_gains.html',
+                           yearly=yearly,
+                           total_realized=sum(row.short_term + row.long_term for row in yearly),
+                           realizations_page=realizations_page,
+                           symbol_filter=symbol,
+                           long_term_days=LONG_TERM_HOLDING_DAYS)
+
 @main_bp.route('/allocation')
 @login_required
 def allocation():
     holdings = Holding.query.filter_by(user_id=current_user.id).all()
     if not holdings: return render_template('allocation.html', allocation_data=[])
     symbols = {h.symbol for h in holdings}
-    price_data_map = {s: stock_api.get_stock_price(s) for s in symbols}
+    price_data_map = get_market_data_loader().prices(symbols)
     allocation_data = []
     for h in holdings:
         price_data = price_data_map.get(h.symbol)
         if price_data and price_data.get('price') is not None:
             allocation_data.append({'symbol': h.symbol, 'value': h.quantity * price_data['price']})
-    return render_template('allocation.html', allocation_data=allocation_data)
+    try:
+        risk_metrics = calculate_risk_metrics({item['symbol']: item['value'] for item in allocation_data})
+    except Exception as e:
+        # 시세 이력 저장 중 실패했다면 세션이 실패한 트랜잭션에 남지 않도록 되돌린다
+        logger.error(f"리스크 지표 계산 오류: {e}"); risk_metrics = None; db.session.rollback()
+    return render_template('allocation.html', allocation_data=allocation_data, risk_metrics=risk_metrics)
+
+@main_bp.route('/api/prices/delta')
+@login_required
+def price_delta():
+    """
+    자동 갱신용 시세 변경분 API. 클라이언트가 마지막으로 받은 시세 버전(since) 이후에 바뀐 종목만 반환하며,
+    ETag가 일치하면 본문 없이 304를 반환한다.
+    """
+    since = request.args.get('since', 0, type=int)
+    holdings = Holding.query.filter_by(user_id=current_user.id).all()
+    symbols = {h.symbol for h in holdings}
+    price_data_map = get_market_data_loader().prices(symbols) if symbols else {}
+
+    version = stock_api.get_price_version()
+    # 시세 버전을 추적할 수 없으면(L1 캐시만 사용 중) 버전이 항상 0이므로 ETag 없이 매번 전체 종목을 보낸다
+    etag = f"{current_user.id}-{get_portfolio_version(current_user.id)}-{version}" if stock_api.versions_available else None
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        changed = stock_api.get_changed_symbols(symbols, since)
+        delta = build_price_delta(holdings, price_data_map, changed)
+        delta['version'] = version
+        response = jsonify(delta)
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# SSE 연결 하나가 워커 스레드를 오래 점유하지 않도록 일정 시간 후 종료 (EventSource가 자동 재연결)
+PRICE_STREAM_MAX_SECONDS = 300
+PRICE_STREAM_KEEPALIVE_SECONDS = 15
+
+@main_bp.route('/api/prices/stream')
+@login_required
+def price_stream():
+    """
+    보유 종목의 시세 변경을 Server-Sent Events로 전달. 이벤트 형식은 /api/prices/delta 응답과 같다.
+    스트리밍을 사용할 수 없으면 503을 반환하며, 클라이언트는 폴링으로 전환한다.
+    """
+    holdings = [SimpleNamespace(symbol=h.symbol, quantity=h.quantity, purchase_price=h.purchase_price)
+                for h in Holding.query.filter_by(user_id=current_user.id).all()]
+    symbols = {h.symbol for h in holdings}
+    subscription = price_broadcaster.subscribe(symbols) if symbols else None
+    if subscription is None:
+        return jsonify({'error': 'streaming unavailable'}), 503
+    price_data_map = get_market_data_loader().prices(symbols)
+
+    def generate():
+        yield f"retry: {PRICE_STREAM_KEEPALIVE_SECONDS * 1000}\n\n"
+        deadline = time.monotonic() + PRICE_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=PRICE_STREAM_KEEPALIVE_SECONDS)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            price_data_map.update(event['prices'])
+            delta = build_price_delta(holdings, price_data_map, event['prices'].keys())
+            delta['version'] = event['version']
+            yield f"id: {event['version']}\nevent: prices\ndata: {json.dumps(delta)}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # 클라이언트 연결이 끊기면 구독 해제
+    response.call_on_close(subscription.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@main_bp.route('/metrics')
+def metrics():
+    # Prometheus 스크레이프용. METRICS_TOKEN이 설정되어 있으면 Bearer 토큰이 일치해야 한다.
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
 
 @main_bp.route('/api/search-stocks')
 @login_required
 def search_stocks():
-    query = request.args.get('q', '').upper()
-    if not query: return jsonify([])
-    results = [stock for stock in US_STOCKS_LIST if query in stock['ticker'].upper() or query in stock['name'].upper()]
-    return jsonify(results[:10])
+    return jsonify(search_us_stocks(request.args.get('q', ''), limit=10))
+
+def _history_args():
+    """차트 기간(range)과 해상도(points) 쿼리 파라미터. 잘못된 값은 기본값/허용 범위로 보정."""
+    range_key = request.args.get('range', DEFAULT_HISTORY_RANGE)
+    if range_key not in PRICE_HISTORY_RANGES:
+        range_key = DEFAULT_HISTORY_RANGE
+    points = request.args.get('points', DEFAULT_HISTORY_POINTS, type=int)
+    return range_key, min(max(points, MIN_HISTORY_POINTS), MAX_HISTORY_POINTS)
 
 @main_bp.route('/stock/<string:symbol>')
 @login_required
 def stock_detail(symbol):
     symbol = symbol.upper()
-    profile = stock_api.get_stock_profile(symbol)
-    price_data = stock_api.get_stock_price(symbol)
-    price_history = stock_api.get_price_history(symbol, period='6mo')
+    range_key, points = _history_args()
+    loader = get_market_data_loader().require([symbol], (PRICE, PROFILE))
+    profile = loader.profile(symbol)
+    price_data = loader.price(symbol)
+    price_history = stock_api.get_price_history(symbol, range_key, points)
     if not price_data or not price_history:
         flash(f'{symbol} 종목 정보를 가져오는 데 실패했습니다.', 'error')
         return redirect(request.referrer or url_for('main.dashboard'))
@@ -197,4 +549,16 @@ def stock_detail(symbol):
                            symbol=symbol,
                            profile=profile,
                            price_data=price_data,
-                           price_history=price_history)
+                           price_history=price_history,
+                           history_ranges=PRICE_HISTORY_RANGES,
+                           history_points=points)
+
+@main_bp.route('/api/stock/<string:symbol>/history')
+@login_required
+def stock_history(symbol):
+    """종목 상세 차트의 기간 전환용 시세 기록 API. 응답 형식은 StockAPIService.get_price_history와 같다."""
+    range_key, points = _history_args()
+    price_history = stock_api.get_price_history(symbol.upper(), range_key, points)
+    if not price_history:
+        return jsonify({'error': 'history unavailable'}), 404
+    return jsonify(price_history)
@@ -0,0 +1,139 @@
+# 📄 services/market_data_loader.py
+
+import logging
+from datetime import timedelta
+from flask import g, has_app_context
+from stock_api import stock_api
+from utils import annual_dps_from_info, build_dividend_payout_schedule
+
+logger = logging.getLogger(__name__)
+
+PRICE = 'price'
+PROFILE = 'profile'
+DIVIDEND_METRICS = 'dividend_metrics'
+PAYOUT_SCHEDULE = 'dividend_payout_schedule'
+ALL_KINDS = (PRICE, PROFILE, DIVIDEND_METRICS, PAYOUT_SCHEDULE)
+
+# 캐시 키 접두사는 데이터 종류 이름과 동일 (예: "price:AAPL")
+CACHE_TTLS = {
+    PRICE: stock_api.cache_ttl,
+    PROFILE: stock_api.cache_ttl,
+    DIVIDEND_METRICS: timedelta(hours=6),
+    PAYOUT_SCHEDULE: timedelta(hours=6),
+}
+
+
+class MarketDataLoader:
+    """
+    요청 단위 시세 데이터 로더.
+    require()로 필요한 (종목, 데이터 종류)를 모아 두었다가, 처음 조회할 때
+    한 번의 캐시 MGET과 한 번의 업스트림 벌크 조회로 모두 해결하고 요청이 끝날 때까지 메모이즈한다.
+    """
+
+    def __init__(self, api=stock_api):
+        self.api = api
+        self._data = {kind: {} for kind in ALL_KINDS}
+        self._pending = {kind: set() for kind in ALL_KINDS}
+
+    def require(self, symbols, kinds=ALL_KINDS):
+        for kind in kinds:
+            self._pending[kind].update(s.upper() for s in symbols if s.upper() not in self._data[kind])
+        return self
+
+    def _get(self, kind, symbols):
+        self.require(symbols, (kind,))
+        self._resolve()
+        return {s.upper(): self._data[kind][s.upper()] for s in symbols if self._data[kind].get(s.upper()) is not None}
+
+    def prices(self, symbols):
+        return self._get(PRICE, symbols)
+
+    def profiles(self, symbols):
+        return self._get(PROFILE, symbols)
+
+    def annual_dividends(self, symbols):
+        """종목별 연간 주당 배당금 {symbol: annual_dps}."""
+        return {s: m.get('annual_dps', 0) for s, m in self._get(DIVIDEND_METRICS, symbols).items()}
+
+    def payout_schedules(self, symbols):
+        return self._get(PAYOUT_SCHEDULE, symbols)
+
+    def price(self, symbol):
+        return self.prices([symbol]).get(symbol.upper())
+
+    def profile(self, symbol):
+        return self.profiles([symbol]).get(symbol.upper())
+
+    def _resolve(self):
+        pending = [(kind, symbol) for kind in ALL_KINDS for symbol in sorted(self._pending[kind])]
+        self._pending = {kind: set() for kind in ALL_KINDS}
+        if not pending:
+            return
+
+        cached_values = self.api.get_many_from_cache([f"{kind}:{symbol}" for kind, symbol in pending])
+        misses = {kind: set() for kind in ALL_KINDS}
+        for (kind, symbol), value in zip(pending, cached_values):
+            if value is not None:
+                self._data[kind][symbol] = value
+            else:
+                misses[kind].add(symbol)
+
+        if any(misses.values()):
+            self._fetch_upstream(misses)
+
+    def _fetch_upstream(self, misses):
+        """
+        캐시에 없는 항목을 종가/배당 이력 벌크 다운로드 1회와 info 조회로 가져온다.
+        info는 종목마다 HTTP 요청이 하나씩 필요하며, fetch_infos_bulk가 제한된 스레드 풀로 병렬 실행한다.
+        """
+        fetched = {kind: {} for kind in ALL_KINDS}
+
+        history_symbols = misses[PRICE] | misses[PAYOUT_SCHEDULE]
+        # 배당 일정이 필요하면 1년치, 시세만 필요하면 최근 며칠치만 조회
+        period = '1y' if misses[PAYOUT_SCHEDULE] else '5d'
+        closes, dividends = self.api.fetch_history_bulk(history_symbols, period=period)
+
+        for symbol in misses[PRICE]:
+            if closes is not None and symbol in closes.columns:
+                price_data = self.api._price_data_from_closes(closes[symbol])
+                if price_data:
+                    fetched[PRICE][symbol] = price_data
+
+        price_fallback = misses[PRICE] - set(fetched[PRICE])
+        if price_fallback:
+            # 업스트림 실패 시 DB에 저장된 마지막 시세를 사용 (캐시에는 저장하지 않음)
+            self._data[PRICE].update(self.api.get_db_cached_prices(price_fallback))
+
+        for symbol in misses[PAYOUT_SCHEDULE]:
+            series = dividends[symbol] if dividends is not None and symbol in dividends.columns else None
+            fetched[PAYOUT_SCHEDULE][symbol] = build_dividend_payout_schedule(series)
+
+        info_symbols = misses[PROFILE] | misses[DIVIDEND_METRICS]
+        infos = self.api.fetch_infos_bulk(info_symbols)
+        for symbol in misses[PROFILE]:
+            fetched[PROFILE][symbol] = self.api._profile_from_info(symbol, infos.get(symbol))
+        for symbol in misses[DIVIDEND_METRICS]:
+            info = infos.get(symbol)
+            if info is None:
+                continue
+            price_data = fetched[PRICE].get(symbol) or self._data[PRICE].get(symbol)
+            fetched[DIVIDEND_METRICS][symbol] = {'annual_dps': annual_dps_from_info(info, price_data)}
+
+        cache_items = {}
+        for kind, values in fetched.items():
+            self._data[kind].update(values)
+            if kind == PRICE: continue
+            for symbol, value in values.items():
+                cache_items[f"{kind}:{symbol}"] = (value, CACHE_TTLS[kind])
+        self.api.set_many_to_cache(cache_items)
+        # 시세는 DB 캐시 갱신과 시세 버전 기록을 함께 수행
+        self.api.store_prices(fetched[PRICE])
+
+
+def get_market_data_loader():
+    """현재 요청(앱 컨텍스트)에 묶인 로더를 반환. 컨텍스트 밖에서는 새 로더를 생성."""
+    if not has_app_context():
+        return MarketDataLoader()
+    if 'market_data_loader' not in g:
+        g.market_data_loader = MarketDataLoader()
+    return g.market_data_loader
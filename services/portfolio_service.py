@@ -1,8 +1,11 @@
 # 📄 services/portfolio_service.py
 
-from stock_api import stock_api
-from utils import calculate_dividend_metrics, get_dividend_payout_schedule
+from utils import calculate_dividend_metrics, get_from_redis_cache, set_to_redis_cache, get_portfolio_version
 from models import Holding
+from app import db
+from stock_api import stock_api
+from services.returns_service import calculate_portfolio_returns
+from services.market_data_loader import get_market_data_loader
 from datetime import datetime
 
 def get_monthly_dividend_distribution(dividend_metrics):
@@ -10,12 +13,12 @@ def get_monthly_dividend_distribution(dividend_metrics):
     [기능 개선] 월별 배당금을 계산할 때, 상세 배당락일 정보를 포함하여 반환.
     """
     detailed_monthly_data = {i: [] for i in range(12)}
+    payout_schedules = get_market_data_loader().payout_schedules(list(dividend_metrics))
     
     for symbol, metrics in dividend_metrics.items():
 
         # 🛠️ Refactoring: 반환된 딕셔너리에서 'payouts' 리스트를 직접 사용
-        dividend_schedule = get_dividend_payout_schedule(symbol)
-        payout_schedule = dividend_schedule['payouts']
+        payout_schedule = payout_schedules.get(symbol, {}).get('payouts', [])
         
         if not payout_schedule:
             continue
@@ -42,41 +45,6 @@ def get_monthly_dividend_distribution(dividend_metrics):
         'datasets': [{'data': monthly_totals}],
         'detailed_data': detailed_monthly_data
     }
-=======
-        if symbol not in monthly_data_by_symbol: monthly_data_by_symbol[symbol] = [0] * 12
-        dividend_info = get_dividend_months(symbol)
-        payout_months = dividend_info.get("months", [])
-        payout_count = dividend_info.get("count", 0)
-        if payout_months and payout_count > 0 and metrics.get('expected_annual_dividend'):
-            amount_per_payout = metrics['expected_annual_dividend'] / payout_count
-
-            
-            # 🛠️ 개선: 1회 지급 시 주당 배당금 계산
-
-            dps_per_payout = (metrics.get('dividend_per_share', 0) / payout_count) if payout_count > 0 else 0
-            for month_str in payout_months:
-                if month_str in month_map:
-                    month_index = month_map[month_str]
-                    monthly_data_by_symbol[symbol][month_index] += amount_per_payout
-                    # 🛠️ 개선: 상세 데이터에 수량 및 주당 배당금 정보 추가
-                    detailed_monthly_data[month_index].append({
-                        'symbol': symbol, 'amount': amount_per_payout,
-                        'profile': metrics.get('profile', {}),
-                        'quantity': metrics.get('quantity', 0),
-                        'dps_per_payout': dps_per_payout
-                    })
-
-
-    # Chart.js가 요구하는 datasets 형식으로 변환 (스택 차트용 - 대시보드에서 사용)
-
-    datasets = []
-    colors = ['#0d6efd', '#198754', '#ffc107', '#dc3545', '#6c757d', '#0dcaf0', '#6f42c1', '#fd7e14', '#20c997', '#6610f2']
-    color_index = 0
-    for symbol, data in monthly_data_by_symbol.items():
-        datasets.append({'label': symbol, 'data': [round(d, 2) for d in data], 'backgroundColor': colors[color_index % len(colors)]})
-        color_index += 1
-    return {'labels': [f"{i+1}월" for i in range(12)], 'datasets': datasets, 'detailed_data': detailed_monthly_data}
-
 
 
 def get_portfolio_analysis_data(user_id):
@@ -88,30 +56,28 @@ def get_portfolio_analysis_data(user_id):
         return None
 
     symbols = list({h.symbol for h in holdings})
-    price_data_map = stock_api.get_stock_prices_bulk(symbols)
-    profile_data_map = stock_api.get_stock_profiles_bulk(symbols)
+    # 이 요청에 필요한 시세/프로필/배당 데이터를 한 번에 일괄 조회
+    loader = get_market_data_loader().require(symbols)
+    price_data_map = loader.prices(symbols)
+    profile_data_map = loader.profiles(symbols)
+    payout_schedules = loader.payout_schedules(symbols)
     
-    dividend_metrics = calculate_dividend_metrics(holdings, price_data_map)
+    dividend_metrics = calculate_dividend_metrics(holdings, price_data_map, loader.annual_dividends(symbols))
+    holdings_by_symbol = {h.symbol: h for h in holdings}
     for symbol, metrics in dividend_metrics.items():
 
-        h = next((h for h in holdings if h.symbol == symbol), None)
+        h = holdings_by_symbol.get(symbol)
         current_price = price_data_map.get(symbol, {}).get('price') or (h.purchase_price if h else 0)
         quantity = h.quantity if h else 0
         current_value = current_price * quantity
         
         # 🛠️ Refactoring: 복잡한 계산 로직을 제거하고, 반환된 딕셔너리에서 'months'를 직접 사용
-        dividend_schedule = get_dividend_payout_schedule(symbol)
-        metrics['payout_months'] = dividend_schedule['months']
+        metrics['payout_months'] = payout_schedules.get(symbol, {}).get('months', [])
 
         metrics['profile'] = profile_data_map.get(symbol, {})
         metrics['quantity'] = quantity
         metrics['current_value'] = current_value
 
-        dividend_info = get_dividend_months(symbol)
-        metrics['payout_months'] = dividend_info.get("months", [])
-        metrics['profile'] = profile_data_map.get(symbol, {})
-        metrics['quantity'] = next((h.quantity for h in holdings if h.symbol == symbol), 0)
-
 
     total_investment = sum(h.quantity * h.purchase_price for h in holdings)
     total_current_value = sum(h.quantity * (price_data_map.get(h.symbol, {}).get('price') or h.purchase_price) for h in holdings)
@@ -130,6 +96,7 @@ def get_portfolio_analysis_data(user_id):
     
     total_profit_loss = total_current_value - total_investment
     summary_data = {'total_investment': total_investment, 'total_current_value': total_current_value, 'total_profit_loss': total_profit_loss, 'total_return_percent': (total_profit_loss / total_investment * 100) if total_investment > 0 else 0}
+    summary_data.update(calculate_portfolio_returns(user_id, price_data_map))
     
     monthly_dividend_data = get_monthly_dividend_distribution(dividend_metrics)
     
@@ -140,3 +107,87 @@ def get_portfolio_analysis_data(user_id):
         "dividend_metrics": dividend_metrics,
         "monthly_dividend_data": monthly_dividend_data,
     }
+
+
+# 스냅샷에 포함된 시세가 시세 캐시보다 오래 유지되지 않도록 같은 수명(30분)을 사용
+SNAPSHOT_TTL_HOURS = stock_api.cache_ttl.total_seconds() / 3600
+
+
+def _held_symbols(user_id):
+    return sorted({s for (s,) in db.session.query(Holding.symbol).filter_by(user_id=user_id).all()})
+
+
+def get_snapshot_version(user_id, symbols=None):
+    """
+    스냅샷 버전 ('포트폴리오 버전:보유 종목 시세 버전'). 보유 종목이 없으면 None.
+    스냅샷에서 파생된 캐시(렌더링된 템플릿 조각, 차트 데이터)의 키에도 사용한다.
+    """
+    symbols = _held_symbols(user_id) if symbols is None else symbols
+    if not symbols:
+        return None
+    return f"{get_portfolio_version(user_id)}:{stock_api.get_symbols_price_version(symbols)}"
+
+
+def _snapshot_key(user_id, symbols):
+    return f"portfolio_snapshot:{user_id}:{get_snapshot_version(user_id, symbols)}"
+
+
+def get_portfolio_snapshot(user_id, refresh=False):
+    """
+    대시보드/배당 페이지용 포트폴리오 분석 결과(JSON 직렬화 가능한 부분)의 스냅샷.
+    포트폴리오 버전과 보유 종목의 시세 버전을 키에 포함하므로, 거래나 시세가 바뀌면 새 스냅샷을 계산한다.
+    배포 시 `flask snapshots build`로 미리 계산해 둘 수 있다.
+    """
+    symbols = _held_symbols(user_id)
+    if not symbols:
+        return None
+    if not refresh:
+        cached = get_from_redis_cache(_snapshot_key(user_id, symbols))
+        if cached:
+            return cached
+
+    portfolio_data = get_portfolio_analysis_data(user_id)
+    if not portfolio_data:
+        return None
+    snapshot = {key: portfolio_data[key] for key in ('summary', 'sector_allocation', 'dividend_metrics', 'monthly_dividend_data')}
+    # 분석 중 시세가 새로 조회되었으면 시세 버전이 바뀌므로 계산 후의 키로 저장
+    set_to_redis_cache(_snapshot_key(user_id, symbols), snapshot, ttl_hours=SNAPSHOT_TTL_HOURS)
+    return snapshot
+
+
+def build_price_delta(holdings, price_data_map, changed_symbols):
+    """
+    자동 갱신용 시세 변경분. 변경된 종목의 시세/평가금액과 포트폴리오 합계만 반환한다.
+    """
+    changed_symbols = set(changed_symbols)
+    prices = {}
+    total_investment = 0
+    total_current_value = 0
+    for h in holdings:
+        price_data = price_data_map.get(h.symbol) or {}
+        current_price = price_data.get('price') or h.purchase_price
+        total_cost = h.quantity * h.purchase_price
+        current_value = h.quantity * current_price
+        total_investment += total_cost
+        total_current_value += current_value
+        if h.symbol in changed_symbols:
+            profit_loss = current_value - total_cost
+            prices[h.symbol] = {
+                'price': current_price,
+                'change': price_data.get('change', 0),
+                'change_percent': price_data.get('change_percent', 0),
+                'current_value': current_value,
+                'profit_loss': profit_loss,
+                'profit_loss_percent': (profit_loss / total_cost) * 100 if total_cost > 0 else 0,
+            }
+
+    total_profit_loss = total_current_value - total_investment
+    return {
+        'prices': prices,
+        'totals': {
+            'total_investment': total_investment,
+            'total_current_value': total_current_value,
+            'total_profit_loss': total_profit_loss,
+            'total_return_percent': (total_profit_loss / total_investment * 100) if total_investment > 0 else 0,
+        },
+    }
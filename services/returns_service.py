@@ -0,0 +1,199 @@
+# 📄 services/returns_service.py
+
+from datetime import date
+import logging
+import numpy as np
+import pandas as pd
+from models import Trade, Dividend
+from utils import get_from_redis_cache, set_to_redis_cache, get_portfolio_version
+
+logger = logging.getLogger(__name__)
+
+DAYS_PER_YEAR = 365.0
+
+# XIRR 초기 구간 탐색에 사용하는 수익률 그리드 (-99% ~ +1000%)
+_RATE_GRID = np.concatenate([np.linspace(-0.99, 1.0, 200), np.linspace(1.05, 10.0, 180)])
+# 초기 그리드에서 해를 찾지 못했을 때의 확장 그리드. 운용 기간이 짧은 포트폴리오는 연환산 수익률이 +1000%를 넘고,
+# 거의 전액 손실이면 -99% 아래로 내려가므로 -100%에 로그 간격으로 다가가고 위쪽은 로그 간격으로 넓힌다
+_EXTENDED_RATE_GRID = np.concatenate([-1.0 + np.logspace(-15, -2, 40), _RATE_GRID, np.logspace(1.1, 20, 80)])
+
+
+def _npv(rates, amounts, years):
+    """수익률 배열(rates)에 대한 NPV를 한 번의 행렬 연산으로 계산."""
+    discount = (1.0 + rates)[:, None] ** (-years[None, :])
+    return discount @ amounts
+
+
+def _sign_changes(rates, amounts, years):
+    """rates 그리드에서 NPV 부호가 바뀌는 인접 구간의 시작 인덱스와 NPV 배열을 반환. 오버플로한 점은 제외한다."""
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        npv_grid = _npv(rates, amounts, years)
+    finite = np.isfinite(npv_grid)
+    signs = np.sign(npv_grid)
+    return np.nonzero(finite[:-1] & finite[1:] & (signs[:-1] != signs[1:]))[0], npv_grid
+
+
+def xirr(amounts, years, tol=1e-10, max_iter=100):
+    """
+    현금흐름(amounts)과 첫 흐름 기준 경과 연수(years)로 XIRR(연환산 금액가중수익률)을 계산.
+    그리드에서 NPV 부호가 바뀌는 구간을 벡터 연산으로 찾은 뒤, 뉴턴법으로 정밀화한다.
+    기본 그리드(-99% ~ +1000%)에 해가 없으면 확장 그리드로 다시 찾으며, 그래도 없으면 None을 반환.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    years = np.asarray(years, dtype=float)
+    if amounts.size < 2 or not (amounts > 0).any() or not (amounts < 0).any():
+        return None
+
+    rates = _RATE_GRID
+    sign_changes, npv_grid = _sign_changes(rates, amounts, years)
+    if sign_changes.size == 0:
+        rates = _EXTENDED_RATE_GRID
+        sign_changes, npv_grid = _sign_changes(rates, amounts, years)
+    if sign_changes.size == 0:
+        return None
+
+    # 0%에 가장 가까운 근을 선택
+    idx = sign_changes[np.argmin(np.abs(rates[sign_changes]))]
+    low, high = rates[idx], rates[idx + 1]
+    low_sign = np.sign(npv_grid[idx])
+    rate = (low + high) / 2
+
+    for _ in range(max_iter):
+        discount = (1.0 + rate) ** (-years)
+        npv = discount @ amounts
+        if abs(npv) < tol:
+            break
+        if np.sign(npv) == low_sign:
+            low = rate
+        else:
+            high = rate
+        d_npv = (-years * discount / (1.0 + rate)) @ amounts
+        new_rate = rate - npv / d_npv if d_npv else (low + high) / 2
+        # 뉴턴 스텝이 구간을 벗어나면 이분법으로 대체
+        if not (low < new_rate < high):
+            new_rate = (low + high) / 2
+        if abs(new_rate - rate) < tol * max(1.0, abs(rate)):
+            rate = new_rate
+            break
+        rate = new_rate
+    return float(rate)
+
+
+def _build_return_state(user_id):
+    """
+    거래/배당 테이블로부터 수익률 계산에 필요한 상태를 생성.
+    - 현금흐름(투자자 관점): 매수 = 음수, 매도/배당 = 양수
+    - TWR: 각 거래일을 구간 경계로 하여, 종목별 마지막 거래 가격으로 평가한 구간 수익률을 누적
+      (저장된 종가(PriceHistory)는 배당/분할 수정 종가라 배당금 현금흐름과 이중 계산되고 거래 수량과 기준이 다르며,
+       /allocation 조회 여부에 따라 채워지므로 사용하지 않는다. 결과가 거래/배당 기록만으로 결정되어 버전 키로 캐시할 수 있다)
+    현재가가 필요한 마지막 구간은 포함하지 않으며, 조회 시점에 현재가로 계산한다.
+    """
+    trades = Trade.query.with_entities(
+        Trade.symbol, Trade.trade_type, Trade.quantity, Trade.price, Trade.trade_date
+    ).filter_by(user_id=user_id).order_by(Trade.trade_date, Trade.id).all()
+    if not trades:
+        return None
+    dividends = Dividend.query.with_entities(
+        Dividend.amount, Dividend.dividend_date
+    ).filter_by(user_id=user_id).all()
+
+    trade_df = pd.DataFrame(trades, columns=['symbol', 'trade_type', 'quantity', 'price', 'trade_date'])
+    trade_df['trade_date'] = pd.to_datetime(trade_df['trade_date'])
+    direction = np.where(trade_df['trade_type'] == 'sell', -1.0, 1.0)
+    trade_df['signed_qty'] = direction * trade_df['quantity']
+    trade_df['cash_in'] = trade_df['signed_qty'] * trade_df['price']
+
+    # 날짜 x 종목 행렬: 보유 수량(누적)과 평가 가격(마지막 거래가, forward-fill)
+    qty_delta = trade_df.pivot_table(index='trade_date', columns='symbol', values='signed_qty', aggfunc='sum', fill_value=0.0)
+    positions = qty_delta.cumsum()
+    marks = trade_df.groupby(['trade_date', 'symbol'])['price'].last().unstack().ffill().fillna(0.0)
+    marks = marks.reindex(index=positions.index, columns=positions.columns)
+
+    pos = positions.to_numpy()
+    mark = marks.to_numpy()
+    flow_dates = positions.index
+    net_cash_in = trade_df.groupby('trade_date')['cash_in'].sum().reindex(flow_dates).to_numpy()
+
+    value_after = np.einsum('ij,ij->i', pos, mark)
+    prev_pos = np.vstack([np.zeros((1, pos.shape[1])), pos[:-1]])
+    value_before = np.einsum('ij,ij->i', prev_pos, mark)
+
+    # 구간(i-1, i] 동안 받은 배당금 합계
+    div_amounts = np.array([d.amount for d in dividends], dtype=float)
+    div_dates = pd.to_datetime([d.dividend_date for d in dividends])
+    dividend_income = np.zeros(len(flow_dates))
+    if div_amounts.size:
+        bins = np.searchsorted(flow_dates.values, div_dates.values, side='left')
+        in_range = bins < len(flow_dates)
+        np.add.at(dividend_income, bins[in_range], div_amounts[in_range])
+        trailing_dividends = float(div_amounts[~in_range].sum())
+    else:
+        trailing_dividends = 0.0
+
+    start_values = value_after[:-1]
+    valid = start_values > 0
+    period_factors = np.ones(len(start_values))
+    period_factors[valid] = (value_before[1:][valid] + dividend_income[1:][valid]) / start_values[valid]
+    growth_factor = float(np.prod(period_factors))
+
+    # XIRR용 현금흐름: 거래는 날짜별 순액, 배당은 지급일 기준
+    cash_flow_dates = np.concatenate([flow_dates.values, div_dates.values]).astype('datetime64[D]')
+    cash_flow_amounts = np.concatenate([-net_cash_in, div_amounts])
+
+    final_positions = positions.iloc[-1]
+    return {
+        'growth_factor': growth_factor,
+        'last_value_after': float(value_after[-1]),
+        'trailing_dividends': trailing_dividends,
+        'positions': {s: float(q) for s, q in final_positions.items() if q > 1e-9},
+        'last_marks': {s: float(p) for s, p in marks.iloc[-1].items()},
+        'flow_days': cash_flow_dates.astype(int).tolist(),
+        'flow_amounts': cash_flow_amounts.tolist(),
+    }
+
+
+def get_return_state(user_id):
+    """거래/배당 버전별로 캐시된 수익률 상태를 반환."""
+    cache_key = f"returns:{user_id}:{get_portfolio_version(user_id)}"
+    state = get_from_redis_cache(cache_key)
+    if state is None:
+        state = _build_return_state(user_id)
+        if state is None:
+            return None
+        set_to_redis_cache(cache_key, state, ttl_hours=24)
+    return state
+
+
+def calculate_portfolio_returns(user_id, price_data_map, as_of=None):
+    """
+    사용자의 시간가중수익률(TWR)과 금액가중수익률(XIRR)을 계산.
+    거래 이력에 의존하는 부분은 캐시된 상태를 사용하고, 현재가가 필요한 마지막 구간만 매번 계산한다.
+    """
+    state = get_return_state(user_id)
+    if not state:
+        return {'time_weighted_return': None, 'money_weighted_return': None}
+
+    as_of = as_of or date.today()
+    current_value = 0.0
+    for symbol, quantity in state['positions'].items():
+        price = (price_data_map.get(symbol) or {}).get('price') or state['last_marks'].get(symbol, 0)
+        current_value += quantity * price
+
+    growth_factor = state['growth_factor']
+    if state['last_value_after'] > 0:
+        growth_factor *= (current_value + state['trailing_dividends']) / state['last_value_after']
+    time_weighted_return = (growth_factor - 1) * 100
+
+    flow_days = np.array(state['flow_days'] + [np.datetime64(as_of, 'D').astype(int)], dtype=float)
+    flow_amounts = np.array(state['flow_amounts'] + [current_value], dtype=float)
+    years = (flow_days - flow_days.min()) / DAYS_PER_YEAR
+    try:
+        irr = xirr(flow_amounts, years)
+    except (FloatingPointError, OverflowError) as e:
+        logger.warning(f"User {user_id}: XIRR 계산 실패: {e}")
+        irr = None
+
+    return {
+        'time_weighted_return': time_weighted_return,
+        'money_weighted_return': irr * 100 if irr is not None else None,
+    }
@@ -0,0 +1,138 @@
+# 📄 services/risk_service.py
+
+import os
+import hashlib
+import logging
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from models import PriceHistory
+from stock_api import stock_api
+from utils import get_from_redis_cache, set_to_redis_cache
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_SYMBOL = os.environ.get('RISK_BENCHMARK_SYMBOL', 'SPY')
+LOOKBACK_DAYS = 365
+TRADING_DAYS_PER_YEAR = 252
+MIN_OBSERVATIONS = 20
+
+
+def _symbol_set_key(symbols):
+    return hashlib.sha1(",".join(sorted(symbols)).encode()).hexdigest()[:16]
+
+
+def get_returns_matrix(symbols, as_of=None):
+    """
+    저장된 시세 이력으로부터 날짜가 정렬된 일별 수익률 행렬을 생성.
+    종목 집합과 날짜 단위로 캐시되며, {'symbols': [...], 'returns': [[...], ...]} (행: 날짜, 열: 종목) 형태로 반환.
+    """
+    symbols = sorted(set(symbols))
+    as_of = as_of or date.today()
+    cache_key = f"risk_returns:{_symbol_set_key(symbols)}:{as_of.isoformat()}"
+    cached = get_from_redis_cache(cache_key)
+    if cached:
+        return cached
+
+    stock_api.sync_price_history(symbols, lookback_days=LOOKBACK_DAYS)
+    rows = PriceHistory.query.with_entities(PriceHistory.date, PriceHistory.symbol, PriceHistory.close).filter(
+        PriceHistory.symbol.in_(symbols),
+        PriceHistory.date > as_of - timedelta(days=LOOKBACK_DAYS),
+        PriceHistory.date <= as_of,
+    ).all()
+    if not rows:
+        return None
+
+    closes = pd.DataFrame(rows, columns=['date', 'symbol', 'close']).pivot(index='date', columns='symbol', values='close')
+    # 이력이 너무 짧은 종목은 제외하고, 거래일이 다른 종목(휴장일 차이 등)은 직전 종가로 맞춘 뒤
+    # 모든 종목의 시세가 존재하는 구간만 사용
+    closes = closes.loc[:, closes.notna().sum() > MIN_OBSERVATIONS]
+    closes = closes.sort_index().ffill().dropna()
+    returns = closes.pct_change().iloc[1:]
+    if len(returns) < MIN_OBSERVATIONS:
+        return None
+
+    result = {
+        'symbols': list(returns.columns),
+        'returns': np.round(returns.to_numpy(), 8).tolist(),
+    }
+    set_to_redis_cache(cache_key, result, ttl_hours=24)
+    return result
+
+
+def calculate_risk_metrics(value_by_symbol, benchmark=BENCHMARK_SYMBOL):
+    """
+    보유 종목별 평가금액(value_by_symbol)으로 포트폴리오 리스크 지표를 계산.
+    상관계수 행렬, 연환산 변동성, 벤치마크 대비 베타, 종목별 리스크 기여도를 행렬 연산으로 한 번에 구한다.
+    """
+    value_by_symbol = {s: v for s, v in value_by_symbol.items() if v > 0}
+    if not value_by_symbol:
+        return None
+
+    matrix = get_returns_matrix(list(value_by_symbol) + [benchmark])
+    if not matrix:
+        return None
+
+    columns = matrix['symbols']
+    returns = np.asarray(matrix['returns'], dtype=float)
+    holding_symbols = [s for s in columns if s in value_by_symbol]
+    if not holding_symbols:
+        return None
+    holding_idx = [columns.index(s) for s in holding_symbols]
+
+    R = returns[:, holding_idx]
+    weights = np.array([value_by_symbol[s] for s in holding_symbols], dtype=float)
+    weights /= weights.sum()
+
+    cov = np.atleast_2d(np.cov(R, rowvar=False)) * TRADING_DAYS_PER_YEAR
+    vol = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.nan_to_num(cov / np.outer(vol, vol))
+    np.fill_diagonal(corr, 1.0)
+
+    portfolio_variance = float(weights @ cov @ weights)
+    portfolio_volatility = np.sqrt(portfolio_variance)
+    marginal = cov @ weights
+    contribution = weights * marginal / portfolio_volatility if portfolio_volatility > 0 else np.zeros_like(weights)
+
+    portfolio_beta = None
+    holding_betas = np.full(len(holding_symbols), np.nan)
+    if benchmark in columns:
+        bench = returns[:, columns.index(benchmark)]
+        bench_centered = bench - bench.mean()
+        bench_var = bench_centered @ bench_centered
+        if bench_var > 0:
+            holding_betas = (R - R.mean(axis=0)).T @ bench_centered / bench_var
+            portfolio_beta = float(weights @ holding_betas)
+
+    # 상관계수가 가장 높은 종목 쌍 (상삼각 행렬만 사용)
+    upper_i, upper_j = np.triu_indices(len(holding_symbols), k=1)
+    pair_corr = corr[upper_i, upper_j]
+    top_pairs = [
+        {'pair': [holding_symbols[upper_i[k]], holding_symbols[upper_j[k]]], 'correlation': float(pair_corr[k])}
+        for k in np.argsort(pair_corr)[::-1][:5]
+    ]
+
+    holdings_risk = sorted([
+        {
+            'symbol': s,
+            'weight': float(weights[i] * 100),
+            'volatility': float(vol[i] * 100),
+            'beta': None if np.isnan(holding_betas[i]) else float(holding_betas[i]),
+            'risk_contribution': float(contribution[i] * 100),
+            'risk_contribution_percent': float(contribution[i] / portfolio_volatility * 100) if portfolio_volatility > 0 else 0,
+        }
+        for i, s in enumerate(holding_symbols)
+    ], key=lambda x: x['risk_contribution_percent'], reverse=True)
+
+    return {
+        'benchmark': benchmark,
+        'observations': int(R.shape[0]),
+        'portfolio_volatility': float(portfolio_volatility * 100),
+        'portfolio_beta': portfolio_beta,
+        'average_correlation': float(pair_corr.mean()) if pair_corr.size else None,
+        'correlation': {'symbols': holding_symbols, 'matrix': np.round(corr, 4).tolist()},
+        'top_correlated_pairs': top_pairs,
+        'holdings': holdings_risk,
+        'missing_symbols': sorted(set(value_by_symbol) - set(holding_symbols)),
+    }
@@ -0,0 +1,191 @@
+# 📄 services/trade_import_service.py
+
+import csv
+import logging
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert
+from app import db
+from models import Trade, recalculate_holdings, QUANTITY_EPSILON
+from utils import bump_portfolio_version
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+PROGRESS_EVERY = 1000
+
+# 증권사 거래내역 CSV마다 다른 헤더 이름을 내부 필드로 매핑 (소문자, 공백 정규화 후 비교)
+HEADER_ALIASES = {
+    'trade_date': ('date', 'trade date', 'trade_date', 'run date', 'transaction date', '거래일', '거래일자', '체결일'),
+    'symbol': ('symbol', 'ticker', 'code', '종목', '종목코드', '심볼'),
+    'trade_type': ('action', 'side', 'type', 'trade type', 'trade_type', 'transaction type', '구분', '거래구분', '매매구분'),
+    'quantity': ('quantity', 'qty', 'shares', '수량', '체결수량'),
+    'price': ('price', 'unit price', 'trade price', '가격', '단가', '체결가'),
+}
+TRADE_TYPE_ALIASES = {
+    'buy': 'buy', 'bought': 'buy', 'b': 'buy', 'you bought': 'buy', '매수': 'buy',
+    'sell': 'sell', 'sold': 'sell', 's': 'sell', 'you sold': 'sell', '매도': 'sell',
+}
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d')
+
+
+class TradeImportError(ValueError):
+    """가져오기 검증 실패. 한 행이라도 오류가 있으면 전체 가져오기를 취소한다."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(errors[0] if errors else '거래 내역을 가져오지 못했습니다.')
+
+
+def _map_headers(fieldnames):
+    normalized = {' '.join(name.strip().lower().split()): name for name in fieldnames or [] if name}
+    mapping, missing = {}, []
+    for field, aliases in HEADER_ALIASES.items():
+        source = next((normalized[a] for a in aliases if a in normalized), None)
+        if source is None:
+            missing.append(field)
+        mapping[field] = source
+    if missing:
+        raise TradeImportError([f"필수 열을 찾을 수 없습니다: {', '.join(missing)} (헤더: {', '.join(fieldnames or [])})"])
+    return mapping
+
+
+def _parse_number(value):
+    return abs(float(value.replace(',', '').replace('$', '').strip()))
+
+
+def _parse_date(value):
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"날짜 형식을 인식할 수 없습니다: '{value}'")
+
+
+def parse_trade_rows(lines, errors, progress=None):
+    """
+    CSV 텍스트 줄(iterable)을 한 줄씩 읽어 (줄 번호, 거래 dict)를 생성하는 제너레이터.
+    업로드 전체를 메모리에 올리지 않으며, 행 단위 오류는 errors 리스트에 모은다.
+    """
+    reader = csv.DictReader(lines)
+    mapping = _map_headers(reader.fieldnames)
+    for row in reader:
+        line_no = reader.line_num
+        if not any((v or '').strip() for v in row.values()):
+            continue
+        try:
+            symbol = (row[mapping['symbol']] or '').strip().upper()
+            trade_type = TRADE_TYPE_ALIASES.get(' '.join((row[mapping['trade_type']] or '').strip().lower().split()))
+            if not symbol:
+                raise ValueError("종목 심볼이 비어 있습니다.")
+            if trade_type is None:
+                raise ValueError(f"거래 구분을 인식할 수 없습니다: '{row[mapping['trade_type']]}'")
+            quantity, price = _parse_number(row[mapping['quantity']] or ''), _parse_number(row[mapping['price']] or '')
+            if quantity <= 0 or price <= 0:
+                raise ValueError("수량과 가격은 0보다 커야 합니다.")
+            trade_date = _parse_date(row[mapping['trade_date']] or '')
+        except (ValueError, TypeError) as e:
+            errors.append(f"{line_no}행: {e}")
+            continue
+        if progress and line_no % PROGRESS_EVERY == 0:
+            progress('parsing', line_no)
+        yield line_no, {'symbol': symbol, 'trade_type': trade_type, 'quantity': quantity, 'price': price, 'trade_date': trade_date}
+
+
+def _validate_positions(user_id, rows, errors):
+    """
+    기존 거래와 가져올 거래를 holdings 재계산과 같은 순서(거래일, 기존 거래 우선, 입력 순)로 합쳐
+    매도 수량이 그 시점의 보유 수량을 넘지 않는지 검증. 대상 종목의 기존 거래는 한 번에 조회한다.
+    """
+    symbols = {r['symbol'] for _, r in rows}
+    existing = db.session.query(Trade.symbol, Trade.trade_type, Trade.quantity, Trade.trade_date).filter(
+        Trade.user_id == user_id, Trade.symbol.in_(symbols)
+    ).order_by(Trade.trade_date, Trade.id).all() if symbols else []
+
+    events = [(t.trade_date, 0, i, None, t.symbol, t.trade_type, t.quantity) for i, t in enumerate(existing)]
+    events += [(r['trade_date'], 1, i, line_no, r['symbol'], r['trade_type'], r['quantity']) for i, (line_no, r) in enumerate(rows)]
+    events.sort(key=lambda e: e[:3])
+
+    positions = Counter()
+    for trade_date, _, _, line_no, symbol, trade_type, quantity in events:
+        if trade_type == 'buy':
+            positions[symbol] += quantity
+            continue
+        if quantity > positions[symbol] + QUANTITY_EPSILON:
+            where = f"{line_no}행" if line_no else "기존 거래"
+            errors.append(f"{where}: {trade_date} {symbol} 매도 수량({quantity:g})이 보유 수량({positions[symbol]:g})을 초과합니다.")
+        positions[symbol] -= quantity
+
+
+def import_trades(user_id, lines, skip_duplicates=True, progress=None):
+    """
+    CSV 거래 내역을 일괄 가져오기.
+    모든 행을 검증한 뒤 한 트랜잭션 안에서 BATCH_SIZE 단위로 bulk insert하고,
+    보유 종목 재계산과 포트폴리오 버전 갱신은 마지막에 한 번만 수행한다.
+    skip_duplicates이면 이미 저장된 거래와 완전히 같은 행은 건너뛰어 같은 파일을 다시 올려도 중복되지 않는다.
+    progress(stage, processed, total=None)로 진행 상황을 보고한다.
+    배당 자격 재계산(update_all_dividends_for_user(rebuild_since=결과['rebuild_since']))은 호출하는 쪽에서 수행한다.
+    """
+    errors = []
+    rows = list(parse_trade_rows(lines, errors, progress))
+    if not rows and not errors:
+        raise TradeImportError(["가져올 거래가 없습니다."])
+    if errors:
+        raise TradeImportError(errors[:MAX_REPORTED_ERRORS])
+
+    # 같은 날짜에는 매수를 매도보다 먼저 반영 (증권사 내역의 당일 정렬 순서와 무관하게)
+    rows.sort(key=lambda r: (r[1]['trade_date'], r[1]['trade_type'] != 'buy', r[0]))
+
+    if skip_duplicates:
+        symbols = {r['symbol'] for _, r in rows}
+        existing_counts = Counter(db.session.query(Trade.symbol, Trade.trade_type, Trade.quantity, Trade.price, Trade.trade_date).filter(
+            Trade.user_id == user_id, Trade.symbol.in_(symbols)
+        ).all())
+        new_rows = []
+        for line_no, r in rows:
+            key = (r['symbol'], r['trade_type'], r['quantity'], r['price'], r['trade_date'])
+            if existing_counts[key] > 0:
+                existing_counts[key] -= 1
+            else:
+                new_rows.append((line_no, r))
+        skipped = len(rows) - len(new_rows)
+        rows = new_rows
+    else:
+        skipped = 0
+
+    if rows:
+        _validate_positions(user_id, rows, errors)
+        if errors:
+            raise TradeImportError(errors[:MAX_REPORTED_ERRORS])
+
+    total = len(rows)
+    try:
+        for start in range(0, total, BATCH_SIZE):
+            batch = [dict(r, user_id=user_id) for _, r in rows[start:start + BATCH_SIZE]]
+            db.session.execute(insert(Trade), batch)
+            if progress:
+                progress('inserting', start + len(batch), total)
+        if total:
+            # recalculate_holdings의 commit이 거래 insert와 lot/보유 종목 갱신을 한 트랜잭션으로 확정
+            recalculate_holdings(user_id, symbols=sorted({r['symbol'] for _, r in rows}))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if total:
+        bump_portfolio_version(user_id)
+    logger.info(f"User {user_id}: 거래 {total}건 가져오기 완료 (중복 {skipped}건 건너뜀).")
+    # 종목별 가장 이른 가져온 거래일. 이 날짜 이후 배당락일의 배당 기록은 보유 수량이 바뀌었을 수 있어 다시 계산해야 한다
+    rebuild_since = {}
+    for _, r in rows:
+        if r['symbol'] not in rebuild_since or r['trade_date'] < rebuild_since[r['symbol']]:
+            rebuild_since[r['symbol']] = r['trade_date']
+    return {
+        'imported': total,
+        'skipped_duplicates': skipped,
+        'symbols': sorted(rebuild_since),
+        'rebuild_since': {symbol: d.isoformat() for symbol, d in sorted(rebuild_since.items())},
+    }
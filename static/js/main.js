@@ -127,10 +127,71 @@ document.addEventListener('DOMContentLoaded', function() {
     // 툴팁 초기화
     const tooltipTriggerList = document.querySelectorAll('[data-bs-toggle="tooltip"]');
     const tooltipList = [...tooltipTriggerList].map(tooltipTriggerEl => new bootstrap.Tooltip(tooltipTriggerEl));
+
+    // 시세가 표시되는 페이지에서만 자동 갱신 시작
+    if (document.querySelector('[data-price-version]')) {
+        startPriceStream();
+    }
 });
 
 // 실시간 업데이트 관련 함수
 let refreshInterval;
+let priceDeltaEtag = null;
+
+// 시세 필드 표시 형식 (템플릿의 서버 렌더링 형식과 동일)
+const PRICE_FIELD_FORMATS = {
+    'currency': value => `$${value.toFixed(2)}`,
+    'signed-currency': value => `$${value >= 0 ? '+' : ''}${value.toFixed(2)}`,
+    'percent': value => `(${value.toFixed(2)}%)`,
+    'signed-percent': value => `(${value >= 0 ? '+' : ''}${value.toFixed(2)}%)`
+};
+
+function updatePriceField(element, value) {
+    const previous = parseFloat(element.dataset.value ?? element.textContent.replace(/[^0-9.+-]/g, ''));
+    const format = PRICE_FIELD_FORMATS[element.dataset.format] || PRICE_FIELD_FORMATS['currency'];
+    element.dataset.value = value;
+    element.textContent = format(value);
+
+    if ('colorize' in element.dataset) {
+        element.classList.toggle('text-success', value >= 0);
+        element.classList.toggle('text-danger', value < 0);
+    }
+    if (!isNaN(previous) && previous !== value) {
+        const animation = value > previous ? 'price-change-up' : 'price-change-down';
+        element.classList.remove('price-change-up', 'price-change-down');
+        void element.offsetWidth; // 애니메이션 재시작
+        element.classList.add(animation);
+    }
+}
+
+function applyPriceDelta(root, delta) {
+    root.dataset.priceVersion = delta.version;
+    Object.entries(delta.prices).forEach(([symbol, fields]) => {
+        document.querySelectorAll(`[data-price-symbol="${symbol}"]`).forEach(element => {
+            const value = fields[element.dataset.priceField];
+            if (value !== undefined) updatePriceField(element, value);
+        });
+    });
+    Object.entries(delta.totals).forEach(([field, value]) => {
+        document.querySelectorAll(`[data-portfolio-field="${field}"]`).forEach(element => updatePriceField(element, value));
+    });
+}
+
+// 마지막으로 받은 시세 버전 이후 변경된 종목만 받아 DOM을 부분 갱신 (변경이 없으면 304)
+function refreshPrices() {
+    const root = document.querySelector('[data-price-version]');
+    if (!root) return Promise.resolve();
+
+    const headers = priceDeltaEtag ? { 'If-None-Match': priceDeltaEtag } : {};
+    return fetch(`/api/prices/delta?since=${root.dataset.priceVersion}`, { headers, cache: 'no-store' })
+        .then(response => {
+            if (response.status === 304 || !response.ok) return null;
+            priceDeltaEtag = response.headers.get('ETag');
+            return response.json();
+        })
+        .then(delta => { if (delta) applyPriceDelta(root, delta); })
+        .catch(error => console.warn('시세 갱신 실패:', error));
+}
 
 function startAutoRefresh(intervalMs = 5 * 60 * 1000) {
     if (refreshInterval) {
@@ -151,11 +212,50 @@ function stopAutoRefresh() {
     }
 }
 
+// 서버 푸시(SSE) 시세 스트림. 사용할 수 없으면 폴링(startAutoRefresh)으로 전환
+let priceStream = null;
+
+function startPriceStream() {
+    const root = document.querySelector('[data-price-version]');
+    if (!root || priceStream) return;
+    if (!window.EventSource) {
+        startAutoRefresh();
+        return;
+    }
+
+    priceStream = new EventSource('/api/prices/stream');
+    priceStream.addEventListener('open', function() {
+        // 스트림 연결 전 놓친 변경분을 따라잡고 폴링 중지
+        stopAutoRefresh();
+        refreshPrices();
+    });
+    priceStream.addEventListener('prices', function(e) {
+        applyPriceDelta(root, JSON.parse(e.data));
+    });
+    priceStream.addEventListener('error', function() {
+        // 재연결 중이거나 서버가 스트리밍을 거부(503)한 경우 폴링으로 대체
+        if (priceStream.readyState === EventSource.CLOSED) {
+            priceStream = null;
+        }
+        startAutoRefresh();
+    });
+}
+
+function stopPriceStream() {
+    if (priceStream) {
+        priceStream.close();
+        priceStream = null;
+    }
+}
+
 // 페이지 가시성 API를 사용한 자동 업데이트 관리
 document.addEventListener('visibilitychange', function() {
+    if (!document.querySelector('[data-price-version]')) return;
     if (document.visibilityState === 'visible') {
-        startAutoRefresh();
+        refreshPrices();
+        startPriceStream();
     } else {
+        stopPriceStream();
         stopAutoRefresh();
     }
 });
@@ -4,13 +4,20 @@ import os
 import requests
 import logging
 import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from sqlalchemy import func
 from app import db
-from models import StockPrice
+from models import StockPrice, PriceHistory
+from price_stream import PRICE_UPDATES_CHANNEL
+from instrumentation import track_upstream, record_upstream
+from utils import lttb_downsample, upsert_rows
+from cache import TieredCache, market_cache
 import yfinance as yf
 import pandas as pd
 from redis import Redis
-import time
 
 try:
     from app import conn as redis_conn
@@ -20,20 +27,40 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# 종목 상세 차트 기간 {range 파라미터: (yfinance period, 표시 이름)}
+PRICE_HISTORY_RANGES = {
+    '1m': ('1mo', '1개월'), '3m': ('3mo', '3개월'), '6m': ('6mo', '6개월'), 'ytd': ('ytd', '올해'),
+    '1y': ('1y', '1년'), '5y': ('5y', '5년'), 'max': ('max', '전체'),
+}
+DEFAULT_HISTORY_RANGE = '6m'
+# 차트 하나에 보내는 최대 점 개수. 기간이 길면 LTTB로 이 개수까지 줄인다
+DEFAULT_HISTORY_POINTS = 400
+MIN_HISTORY_POINTS, MAX_HISTORY_POINTS = 50, 2000
+# info 조회(종목당 HTTP 요청 1회) 동시 실행 수
+INFO_FETCH_WORKERS = int(os.environ.get('INFO_FETCH_WORKERS', 8))
+
 US_STOCKS_LIST = []
 US_STOCKS_FILE = 'us_stocks.json'
+# 종목 검색 접두사 인덱스 {접두사: [US_STOCKS_LIST 위치, ...]}
+SEARCH_INDEX = {}
+SEARCH_PREFIX_LENGTH = 4
 
-def load_us_stocks_data():
+def load_us_stocks_data(force=False):
+    """
+    SEC 기업 티커 목록을 로드하고 검색 인덱스를 생성. 하루 이내의 로컬 파일 캐시가 있으면 파일을 사용하며,
+    force=True이면 파일 캐시와 관계없이 SEC에서 다시 받아 파일을 갱신한다.
+    """
     global US_STOCKS_LIST
-    if US_STOCKS_LIST: return
+    if US_STOCKS_LIST and not force: return
     try:
         file_exists = os.path.exists(US_STOCKS_FILE)
-        if file_exists:
+        if file_exists and not force:
             file_mod_time = datetime.fromtimestamp(os.path.getmtime(US_STOCKS_FILE))
             if (datetime.now() - file_mod_time) < timedelta(days=1):
                 with open(US_STOCKS_FILE, 'r') as f:
                     US_STOCKS_LIST = json.load(f)
                 logger.info(f"로컬 캐시 파일({US_STOCKS_FILE})에서 주식 데이터 {len(US_STOCKS_LIST)}개 로드 완료.")
+                build_search_index()
                 return
         headers = {'User-Agent': 'WealthTracker/1.0 (dev@example.com)'}
         url = "https://www.sec.gov/files/company_tickers.json"
@@ -54,185 +81,331 @@ def load_us_stocks_data():
              with open(US_STOCKS_FILE, 'r') as f:
                 US_STOCKS_LIST = json.load(f)
              logger.warning("API 실패. 기존 로컬 캐시 파일을 사용합니다.")
+    build_search_index()
+
+def build_search_index():
+    """티커와 회사명 각 단어의 앞 SEARCH_PREFIX_LENGTH 글자까지의 접두사로 검색 인덱스를 생성."""
+    global SEARCH_INDEX
+    index = defaultdict(list)
+    for position, stock in enumerate(US_STOCKS_LIST):
+        prefixes = set()
+        for word in [stock['ticker'].upper()] + stock['name'].upper().split():
+            prefixes.update(word[:n] for n in range(1, min(len(word), SEARCH_PREFIX_LENGTH) + 1))
+        for prefix in prefixes:
+            index[prefix].append(position)
+    SEARCH_INDEX = dict(index)
+    return SEARCH_INDEX
+
+def search_us_stocks(query, limit=10):
+    """
+    종목 검색. 접두사 인덱스로 후보를 좁혀 티커 일치 > 티커 접두사 > 회사명 단어 접두사 순으로 정렬하고,
+    결과가 부족하면 기존처럼 티커/회사명에 포함된 종목으로 보충한다.
+    """
+    query = query.upper().strip()
+    if not query: return []
+    ranked = []
+    for position in SEARCH_INDEX.get(query[:SEARCH_PREFIX_LENGTH], []):
+        stock = US_STOCKS_LIST[position]
+        ticker, name = stock['ticker'].upper(), stock['name'].upper()
+        if ticker == query: rank = 0
+        elif ticker.startswith(query): rank = 1
+        elif name.startswith(query) or any(word.startswith(query) for word in name.split()): rank = 2
+        else: continue
+        ranked.append((rank, len(ticker), position))
+    positions = [position for *_, position in sorted(ranked)[:limit]]
+
+    if len(positions) < limit:
+        found = set(positions)
+        for position, stock in enumerate(US_STOCKS_LIST):
+            if len(positions) >= limit: break
+            if position not in found and (query in stock['ticker'].upper() or query in stock['name'].upper()):
+                positions.append(position)
+    return [US_STOCKS_LIST[position] for position in positions]
 
 
 class StockAPIService:
-    def __init__(self, redis_client: Redis):
+    def __init__(self, redis_client: Redis, store: TieredCache = None):
         self.session = requests.Session()
-        self.cache = redis_client
+        # 시세/프로필/배당 데이터 캐시는 L1+Redis 계층 store, 시세 버전/pub-sub 등 Redis 전용 명령은 store.redis_call을 사용
+        self.store = store or TieredCache(redis_client)
         self.cache_ttl = timedelta(minutes=30)
 
     def _get_from_redis_cache(self, key):
-        if not self.cache: return None
-        cached = self.cache.get(key)
-        return json.loads(cached) if cached else None
+        return self.store.get(key)
 
     def _set_to_redis_cache(self, key, value):
-        if not self.cache: return
-        self.cache.setex(key, self.cache_ttl, json.dumps(value))
+        self.store.set(key, value, self.cache_ttl)
+
+    def get_many_from_cache(self, keys):
+        """여러 키를 L1 캐시와 한 번의 MGET으로 조회. 키 순서대로 값(없으면 None) 리스트를 반환."""
+        if not keys: return []
+        return self.store.get_many(keys)
+
+    def set_many_to_cache(self, items):
+        """{키: (값, TTL)} 형태의 항목을 L1 캐시와 Redis(하나의 파이프라인)에 저장."""
+        self.store.set_many(items)
+
+    @staticmethod
+    def _price_data_from_closes(closes):
+        closes = closes.dropna()
+        if len(closes) >= 2:
+            return {
+                'price': float(closes.iloc[-1]),
+                'change': float(closes.iloc[-1] - closes.iloc[-2]),
+                'change_percent': float((closes.iloc[-1] / closes.iloc[-2] - 1) * 100)
+            }
+        if len(closes) == 1:
+            return {'price': float(closes.iloc[-1]), 'change': 0, 'change_percent': 0}
+        return None
+
+    @staticmethod
+    def _profile_from_info(symbol, info):
+        if not info:
+            return {'name': symbol, 'sector': 'N/A', 'logo_url': None}
+        return {
+            'name': info.get('longName', symbol),
+            'sector': info.get('sector', 'ETF' if info.get('quoteType') == 'ETF' else 'N/A'),
+            'logo_url': info.get('logo_url')
+        }
 
     def get_stock_prices_bulk(self, symbols: list):
         if not symbols: return {}
-        
-        results = {}
-        symbols_to_fetch = []
-        for symbol in symbols:
-            cache_key = f"price:{symbol}"
-            cached_price = self._get_from_redis_cache(cache_key)
-            if cached_price:
-                results[symbol] = cached_price
-            else:
-                symbols_to_fetch.append(symbol)
-        
+
+        cached_values = self.get_many_from_cache([f"price:{symbol}" for symbol in symbols])
+        results = {symbol: cached for symbol, cached in zip(symbols, cached_values) if cached}
+        symbols_to_fetch = [symbol for symbol in symbols if symbol not in results]
         if not symbols_to_fetch:
             return results
 
-        try:
-            tickers_str = " ".join(symbols_to_fetch)
-            tickers = yf.Tickers(tickers_str)
-            for symbol, ticker_obj in tickers.tickers.items():
-                # 🛠️ Fixed: 'progress' 인수는 yf.Tickers() 내의 개별 history() 호출에서 지원되지 않으므로 제거합니다.
-                hist = ticker_obj.history(period="2d", auto_adjust=True)
-                if not hist.empty and len(hist) >= 2:
-                    price_data = {
-                        'price': float(hist['Close'].iloc[-1]),
-                        'change': float(hist['Close'].iloc[-1] - hist['Close'].iloc[-2]),
-                        'change_percent': float((hist['Close'].iloc[-1] / hist['Close'].iloc[-2] - 1) * 100)
-                    }
-                elif not hist.empty:
-                    price_data = {'price': float(hist['Close'].iloc[-1]), 'change': 0, 'change_percent': 0}
-                else:
-                    continue
-
-                results[symbol] = price_data
-                self._set_to_redis_cache(f"price:{symbol}", price_data)
-                self._update_db_cache(symbol, price_data)
-
-        except Exception as e:
-            logger.error(f"yfinance 벌크 가격 조회 실패 ({symbols_to_fetch}): {e}")
+        closes, _ = self.fetch_history_bulk(symbols_to_fetch)
+        fetched = {}
+        for symbol in symbols_to_fetch:
+            if closes is None or symbol not in closes.columns: continue
+            price_data = self._price_data_from_closes(closes[symbol])
+            if price_data:
+                fetched[symbol] = price_data
 
+        results.update(fetched)
+        self.store_prices(fetched)
         return results
-        
+
     def get_stock_profiles_bulk(self, symbols: list):
         if not symbols: return {}
 
-        results = {}
-        symbols_to_fetch = []
-        for symbol in symbols:
-            cache_key = f"profile:{symbol}"
-            cached_profile = self._get_from_redis_cache(cache_key)
-            if cached_profile:
-                results[symbol] = cached_profile
-            else:
-                symbols_to_fetch.append(symbol)
-
+        cached_values = self.get_many_from_cache([f"profile:{symbol}" for symbol in symbols])
+        results = {symbol: cached for symbol, cached in zip(symbols, cached_values) if cached}
+        symbols_to_fetch = [symbol for symbol in symbols if symbol not in results]
         if not symbols_to_fetch:
             return results
-        
-        try:
-            tickers_str = " ".join(symbols_to_fetch)
-            tickers = yf.Tickers(tickers_str)
-            for symbol, ticker_obj in tickers.tickers.items():
-                try:
-                    info = ticker_obj.info
-                    profile_data = {
-                        'name': info.get('longName', symbol),
-                        'sector': info.get('sector', 'ETF' if info.get('quoteType') == 'ETF' else 'N/A'),
-                        'logo_url': info.get('logo_url')
-                    }
-                except Exception:
-                     profile_data = {'name': symbol, 'sector': 'N/A', 'logo_url': None}
-
-                results[symbol] = profile_data
-                self._set_to_redis_cache(f"profile:{symbol}", profile_data)
-        except Exception as e:
-            logger.error(f"yfinance 벌크 프로필 조회 실패 ({symbols_to_fetch}): {e}")
 
+        infos = self.fetch_infos_bulk(symbols_to_fetch)
+        fetched = {symbol: self._profile_from_info(symbol, infos.get(symbol)) for symbol in symbols_to_fetch}
+        results.update(fetched)
+        self.set_many_to_cache({f"profile:{symbol}": (profile, self.cache_ttl) for symbol, profile in fetched.items()})
         return results
 
-    def get_stock_price(self, symbol):
-        time.sleep(0.1)
-        cache_key = f"price:{symbol}"
-        cached_price = self._get_from_redis_cache(cache_key)
-        if cached_price: return cached_price
-        
-        db_cached = StockPrice.query.filter_by(symbol=symbol).first()
-        if db_cached and (datetime.utcnow() - db_cached.last_updated) < self.cache_ttl:
-            return {'price': db_cached.current_price, 'change': db_cached.change, 'change_percent': db_cached.change_percent}
+    def store_prices(self, price_map):
+        """
+        새로 조회한 시세를 Redis 캐시와 DB에 저장하고, 가격이 바뀐 종목의 시세 버전을 갱신.
+        업스트림 시세 갱신은 모두 이 메서드를 거친다.
+        """
+        if not price_map: return
+        self.set_many_to_cache({f"price:{symbol}": (price_data, self.cache_ttl) for symbol, price_data in price_map.items()})
+        changed = self._update_db_cache_bulk(price_map)
+        self._record_price_changes({symbol: price_map[symbol] for symbol in changed})
+
+    def _record_price_changes(self, changed_prices):
+        """
+        전역 시세 버전(price_version)을 증가시키고, 변경된 종목에 해당 버전을 기록한 뒤
+        시세 변경 이벤트를 pub/sub 채널로 발행 (SSE 스트림이 구독).
+        """
+        if not changed_prices: return
+
+        def command(redis):
+            version = redis.incr("price_version")
+            pipe = redis.pipeline(transaction=False)
+            pipe.hset("price_versions", mapping={symbol: version for symbol in changed_prices})
+            pipe.publish(PRICE_UPDATES_CHANNEL, json.dumps({'version': version, 'prices': changed_prices}))
+            pipe.execute()
+        self.store.redis_call(command)
+
+    @property
+    def versions_available(self):
+        """시세 버전을 Redis에서 관리할 수 있는지 여부. False이면 버전은 항상 0이고 변경 종목을 추적하지 않는다."""
+        return self.store.redis_available
+
+    def get_price_version(self):
+        version = self.store.redis_call(lambda r: r.get("price_version"))
+        return int(version) if version else 0
+
+    def get_symbols_price_version(self, symbols):
+        """주어진 종목들의 시세 버전 중 최댓값. 종목 집합 단위 캐시 키에 사용."""
+        if not symbols: return 0
+        versions = self.store.redis_call(lambda r: r.hmget("price_versions", list(symbols)), [])
+        return max((int(v) for v in versions if v), default=0)
 
+    def get_changed_symbols(self, symbols, since_version):
+        """
+        since_version 이후에 시세가 바뀐 종목 목록.
+        시세 버전을 조회할 수 없으면(L1 캐시만 사용 중) 어떤 종목이 바뀌었는지 알 수 없으므로 모든 종목을 반환한다.
+        """
+        if not symbols: return []
+        symbols = list(symbols)
+        versions = self.store.redis_call(lambda r: r.hmget("price_versions", symbols))
+        if versions is None:
+            return symbols
+        return [s for s, v in zip(symbols, versions) if v and int(v) > since_version]
+
+    def _update_db_cache_bulk(self, price_map):
+        """여러 종목의 DB 시세 캐시를 한 번의 조회와 한 번의 upsert로 갱신. 가격이 바뀐 종목 집합을 반환."""
+        if not price_map: return set()
+        existing = dict(db.session.query(StockPrice.symbol, StockPrice.current_price).filter(
+            StockPrice.symbol.in_(list(price_map))
+        ).all())
+        now = datetime.utcnow()
+        rows = [{
+            'symbol': symbol,
+            'current_price': float(price_data['price']),
+            'change': float(price_data.get('change', 0)),
+            'change_percent': float(price_data.get('change_percent', 0)),
+            'last_updated': now,
+        } for symbol, price_data in price_map.items()]
+        upsert_rows(StockPrice, rows, ('symbol',), ('current_price', 'change', 'change_percent', 'last_updated'))
+        db.session.commit()
+        return {row['symbol'] for row in rows if existing.get(row['symbol']) != row['current_price']}
+
+    def get_db_cached_prices(self, symbols):
+        """업스트림 조회 실패 시 사용할 DB 시세 캐시를 한 번의 쿼리로 조회."""
+        if not symbols: return {}
+        rows = StockPrice.query.filter(StockPrice.symbol.in_(list(symbols))).all()
+        return {r.symbol: {'price': r.current_price, 'change': r.change, 'change_percent': r.change_percent} for r in rows}
+
+    def fetch_history_bulk(self, symbols, period='5d'):
+        """
+        여러 종목의 종가와 배당 이력을 한 번의 벌크 다운로드로 조회.
+        (종가 DataFrame, 배당 DataFrame) 튜플을 반환하며, 열은 종목 심볼이다.
+        """
+        if not symbols: return None, None
         try:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period="2d", auto_adjust=True)
-            if not hist.empty and len(hist) >= 2:
-                price_data = {
-                    'price': float(hist['Close'].iloc[-1]),
-                    'change': float(hist['Close'].iloc[-1] - hist['Close'].iloc[-2]),
-                    'change_percent': float((hist['Close'].iloc[-1] / hist['Close'].iloc[-2] - 1) * 100)
-                }
-            elif not hist.empty:
-                price_data = {'price': float(hist['Close'].iloc[-1]), 'change': 0, 'change_percent': 0}
-            else:
-                return None
+            with track_upstream('yfinance_download'):
+                data = yf.download(sorted(symbols), period=period, auto_adjust=True, actions=True, progress=False, threads=True)
         except Exception as e:
-            logger.error(f"yfinance 가격 조회 실패 ({symbol}): {e}")
-            if db_cached:
-                return {'price': db_cached.current_price, 'change': db_cached.change, 'change_percent': db_cached.change_percent}
-            return None
+            logger.error(f"yfinance 벌크 이력 조회 실패 ({sorted(symbols)}): {e}")
+            return None, None
+        if data is None or data.empty:
+            return None, None
+        if data.index.tz is not None:
+            data.index = data.index.tz_convert(None)
+
+        def _frame(field):
+            if field not in data.columns.get_level_values(0): return None
+            frame = data[field]
+            return frame.to_frame(name=next(iter(symbols))) if isinstance(frame, pd.Series) else frame
+
+        return _frame('Close'), _frame('Dividends')
+
+    def fetch_infos_bulk(self, symbols):
+        """
+        여러 종목의 info를 조회. 실패한 종목은 None.
+        yfinance의 info는 종목마다 별도 HTTP 요청이라 벌크로 묶을 수 없으므로, 최대 INFO_FETCH_WORKERS개 스레드로 병렬 조회한다.
+        """
+        if not symbols: return {}
+        symbols = sorted(symbols)
+
+        def fetch(symbol):
+            try:
+                return yf.Ticker(symbol).info
+            except Exception as e:
+                logger.warning(f"info 조회 실패 ({symbol}): {e}")
+                return None
 
-        self._set_to_redis_cache(cache_key, price_data)
-        self._update_db_cache(symbol, price_data)
-        return price_data
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(INFO_FETCH_WORKERS, len(symbols))) as executor:
+            infos = dict(zip(symbols, executor.map(fetch, symbols)))
+        # 작업 스레드에는 요청 컨텍스트가 없으므로 호출 수와 전체 경과 시간을 요청 스레드에서 기록
+        record_upstream('yfinance_info', time.perf_counter() - started, calls=len(symbols))
+        return infos
 
-    def get_stock_profile(self, symbol):
-        time.sleep(0.1)
-        cache_key = f"profile:{symbol}"
-        cached_profile = self._get_from_redis_cache(cache_key)
-        if cached_profile: return cached_profile
+    def get_price_history(self, symbol, range_key=DEFAULT_HISTORY_RANGE, points=DEFAULT_HISTORY_POINTS):
+        """
+        기간(range_key)별 일별 종가. 점 개수가 points를 넘으면 LTTB로 다운샘플링하며, total_points는 다운샘플링 전 점 개수.
+        캐시에는 종목/기간별 원본 종가 시계열을 한 번만 두고 요청마다 다운샘플링하므로,
+        points 값이 달라도 업스트림을 다시 호출하지 않는다.
+        """
+        series = self._get_close_series(symbol, range_key)
+        if not series: return None
+        indices = lttb_downsample(series['prices'], points)
+        return {
+            'range': range_key,
+            'dates': [series['dates'][i] for i in indices],
+            'prices': [series['prices'][i] for i in indices],
+            'total_points': len(series['prices']),
+        }
 
+    def _get_close_series(self, symbol, range_key):
+        """종목/기간별 원본 일별 종가 시계열({'dates', 'prices'})을 캐시에서 읽거나 업스트림에서 받아 캐시."""
+        period = PRICE_HISTORY_RANGES[range_key][0]
+        cache_key = f"history:{symbol}:{range_key}"
+        cached_series = self._get_from_redis_cache(cache_key)
+        if cached_series: return cached_series
         try:
-            info = yf.Ticker(symbol).info
-            profile_data = {
-                'name': info.get('longName', symbol),
-                'sector': info.get('sector', 'ETF' if info.get('quoteType') == 'ETF' else 'N/A'),
-                'logo_url': info.get('logo_url')
+            with track_upstream('yfinance_history'):
+                hist = yf.Ticker(symbol).history(period=period, auto_adjust=True)
+            closes = hist['Close'].dropna() if not hist.empty else None
+            if closes is None or closes.empty: return None
+            series = {
+                'dates': list(closes.index.strftime('%Y-%m-%d')),
+                'prices': [round(float(p), 2) for p in closes],
             }
         except Exception as e:
-            logger.warning(f"프로필 조회 실패 ({symbol}): {e}")
-            profile_data = {'name': symbol, 'sector': 'N/A', 'logo_url': None}
-
-        self._set_to_redis_cache(cache_key, profile_data)
-        return profile_data
-
-    def _update_db_cache(self, symbol, price_data):
-        with db.session.no_autoflush:
-            cached = StockPrice.query.filter_by(symbol=symbol).first()
-            if not cached:
-                cached = StockPrice(symbol=symbol)
-                db.session.add(cached)
-            cached.current_price = float(price_data['price'])
-            cached.change = float(price_data.get('change', 0))
-            cached.change_percent = float(price_data.get('change_percent', 0))
-            cached.last_updated = datetime.utcnow()
-            db.session.commit()
-    
-    def get_price_history(self, symbol, period='6mo'):
-        cache_key = f"history:{symbol}:{period}"
-        cached_history = self._get_from_redis_cache(cache_key)
-        if cached_history: return cached_history
+            logger.error(f"시세 기록 조회 실패 ({symbol}, {range_key}): {e}")
+            return None
+
+        self._set_to_redis_cache(cache_key, series)
+        return series
+
+    def sync_price_history(self, symbols, lookback_days=365):
+        """
+        PriceHistory 테이블에 종목별 일별 종가를 최신 상태로 저장.
+        종가는 분할/배당 수정 종가(auto_adjust)이므로 새 분할이나 배당이 생기면 과거 값 전체가 바뀐다.
+        마지막 날짜 이후만 이어 붙이면 이미 저장된 구간과 수정 기준이 달라져 수익률이 튀므로,
+        최신이 아닌 종목은 lookback 구간 전체를 한 번의 벌크 다운로드로 다시 받아 덮어쓴다 (upsert).
+        """
+        if not symbols: return
+        today = datetime.utcnow().date()
+        start = today - timedelta(days=lookback_days)
+
+        latest_rows = db.session.query(PriceHistory.symbol, func.max(PriceHistory.date)).filter(
+            PriceHistory.symbol.in_(symbols)
+        ).group_by(PriceHistory.symbol).all()
+        latest_dates = dict(latest_rows)
+
+        stale = [s for s in symbols if not latest_dates.get(s) or latest_dates[s] < today - timedelta(days=1)]
+        if not stale:
+            return
+
         try:
-            hist = yf.Ticker(symbol).history(period=period, auto_adjust=True)
-            if hist.empty: return None
-            
-            hist.index = hist.index.strftime('%Y-%m-%d')
-            price_history = {
-                'dates': list(hist.index),
-                'prices': [round(p, 2) for p in hist['Close']]
-            }
+            with track_upstream('yfinance_download'):
+                data = yf.download(stale, start=start.strftime('%Y-%m-%d'), auto_adjust=True, progress=False, threads=True)
+            if data is None or data.empty:
+                return
+            closes = data['Close']
+            if isinstance(closes, pd.Series):
+                closes = closes.to_frame(name=stale[0])
+            if closes.index.tz is not None:
+                closes.index = closes.index.tz_convert(None)
         except Exception as e:
-            logger.error(f"시세 기록 조회 실패 ({symbol}): {e}")
-            return None
-        
-        self._set_to_redis_cache(cache_key, price_history)
-        return price_history
+            logger.error(f"yfinance 시세 이력 벌크 조회 실패 ({stale}): {e}")
+            return
+
+        rows = []
+        for symbol in stale:
+            if symbol not in closes.columns: continue
+            rows.extend({'symbol': symbol, 'date': ts.date(), 'close': float(close)} for ts, close in closes[symbol].dropna().items())
+        if rows:
+            # 동시에 같은 종목을 동기화하는 요청이 있어도 (symbol, date) 충돌 없이 같은 값으로 덮어쓴다
+            upsert_rows(PriceHistory, rows, ('symbol', 'date'), ('close',))
+            db.session.commit()
+            logger.info(f"시세 이력 {len(rows)}건 저장 완료 ({len(stale)}개 종목).")
 
-stock_api = StockAPIService(redis_conn)
+stock_api = StockAPIService(redis_conn, market_cache)
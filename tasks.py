@@ -4,8 +4,12 @@ import yfinance as yf
 import pandas as pd
 from app import db, app
 from models import Holding, Dividend, DividendUpdateCache, Trade
+from utils import bump_portfolio_version
+import codecs
 import logging
-from datetime import datetime, timedelta
+from bisect import bisect_left
+from itertools import groupby
+from datetime import datetime, date, timedelta
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -32,16 +36,46 @@ def get_quantity_on_date(user_id, symbol, target_date):
     return quantity if quantity > 0 else 0
 
 
-def update_all_dividends_for_user(user_id):
+def _holding_timelines(user_id):
+    """
+    종목별 보유 수량 타임라인 {symbol: (거래일 리스트, 누적 수량 리스트)}을 한 번의 쿼리로 생성.
+    배당락일마다 get_quantity_on_date를 호출하는 대신 이분 탐색으로 보유 수량을 구하는 데 사용.
+    """
+    trades = db.session.query(Trade.symbol, Trade.trade_type, Trade.quantity, Trade.trade_date).filter_by(
+        user_id=user_id
+    ).order_by(Trade.symbol, Trade.trade_date, Trade.id).all()
+    timelines = {}
+    for symbol, symbol_trades in groupby(trades, key=lambda t: t.symbol):
+        dates, cumulative, quantity = [], [], 0
+        for trade in symbol_trades:
+            quantity += trade.quantity if trade.trade_type == 'buy' else -trade.quantity
+            dates.append(trade.trade_date)
+            cumulative.append(quantity)
+        timelines[symbol] = (dates, cumulative)
+    return timelines
+
+
+def _quantity_from_timeline(timeline, target_date):
+    """target_date 이전 거래까지 반영한 보유 수량 (get_quantity_on_date와 동일한 기준)."""
+    dates, cumulative = timeline
+    idx = bisect_left(dates, target_date)
+    quantity = cumulative[idx - 1] if idx > 0 else 0
+    return quantity if quantity > 0 else 0
+
+
+def update_all_dividends_for_user(user_id, force=False, rebuild_since=None):
     """
     [배당락일 로직 개선]
     사용자의 전체 보유 종목에 대해, '배당락일' 기준 보유 수량을 계산하여
     실제 받을 배당금을 'Dividend' 테이블에 기록하는 백그라운드 작업.
+    force=True이면 6시간 이내 갱신 여부와 관계없이 실행 (거래 일괄 가져오기 후 등).
+    rebuild_since({종목: 'YYYY-MM-DD'})를 주면 해당 종목은 그 날짜 이후 배당락일의 기존 기록을 지우고
+    현재 거래 기록 기준의 보유 수량으로 다시 계산한다 (과거 날짜 거래를 가져와 보유 수량이 바뀐 경우).
     """
     with app.app_context():
         try:
             last_update_record = DividendUpdateCache.query.filter_by(user_id=user_id).first()
-            if last_update_record and (datetime.utcnow() - last_update_record.last_updated) < timedelta(hours=6):
+            if not force and last_update_record and (datetime.utcnow() - last_update_record.last_updated) < timedelta(hours=6):
                 logger.info(f"User {user_id}: 6시간 이내에 이미 배당금 업데이트를 시도했습니다. 건너뜁니다.")
                 return
 
@@ -52,61 +86,69 @@ def update_all_dividends_for_user(user_id):
                 logger.info(f"User {user_id}: 거래 기록이 없어 배당금 업데이트를 종료합니다.")
                 return
 
-            total_new_dividends = 0
+            rebuild_since = {symbol: date.fromisoformat(since) if isinstance(since, str) else since
+                             for symbol, since in (rebuild_since or {}).items()}
+            timelines = _holding_timelines(user_id)
+            # 다시 계산할 기간의 기존 기록은 중복 검사에서 제외 (업스트림 조회에 성공한 종목만 마지막에 삭제 후 다시 추가)
+            existing_ex_dates = {(symbol, ex_date) for symbol, ex_date in
+                                 db.session.query(Dividend.symbol, Dividend.ex_dividend_date).filter_by(user_id=user_id).all()
+                                 if symbol not in rebuild_since or ex_date < rebuild_since[symbol]}
+
+            new_dividends, rebuilt_symbols = [], []
             for (symbol,) in symbols_traded:
                 try:
                     ticker = yf.Ticker(symbol)
                     # 배당락일(Ex-Date) 정보를 얻기 위해 .actions 사용
                     actions = ticker.actions
-                    if actions is None or actions.empty or 'Dividends' not in actions.columns:
+                except Exception as e:
+                    logger.error(f"User {user_id}, Symbol {symbol} 처리 중 오류: {e}")
+                    continue
+                if symbol in rebuild_since:
+                    rebuilt_symbols.append(symbol)
+                if actions is None or actions.empty or 'Dividends' not in actions.columns:
+                    continue
+
+                # 배당 정보만 필터링 (주식 분할 등 제외)
+                dividends_data = actions[actions['Dividends'] > 0]
+
+                # yfinance에서 가져온 데이터에는 지급일(Pay Date)이 없으므로, 배당락일로 대체.
+                # 더 정확한 지급일 정보는 다른 API 소스가 필요.
+                for ex_dividend_date, row in dividends_data.iterrows():
+                    amount_per_share = row['Dividends']
+                    ex_date_native = ex_dividend_date.date()
+
+                    # 1. 이 배당락일 기준으로, 사용자가 이 배당을 받을 자격이 있는지 확인
+                    quantity_on_ex_date = _quantity_from_timeline(timelines[symbol], ex_date_native)
+
+                    if quantity_on_ex_date <= 0:
                         continue
-                    
-                    # 배당 정보만 필터링 (주식 분할 등 제외)
-                    dividends_data = actions[actions['Dividends'] > 0]
-                    if dividends_data.empty:
+
+                    # 2. 이미 DB에 동일한 배당락일의 기록이 있는지 확인 (중복 방지)
+                    if (symbol, ex_date_native) in existing_ex_dates:
                         continue
 
-                    # yfinance에서 가져온 데이터에는 지급일(Pay Date)이 없으므로, 배당락일로 대체.
-                    # 더 정확한 지급일 정보는 다른 API 소스가 필요.
-                    for ex_dividend_date, row in dividends_data.iterrows():
-                        amount_per_share = row['Dividends']
-                        ex_date_native = ex_dividend_date.date()
-                        
-                        # 1. 이 배당락일 기준으로, 사용자가 이 배당을 받을 자격이 있는지 확인
-                        quantity_on_ex_date = get_quantity_on_date(user_id, symbol, ex_date_native)
-                        
-                        if quantity_on_ex_date <= 0:
-                            continue
-
-                        # 2. 이미 DB에 동일한 배당락일의 기록이 있는지 확인 (중복 방지)
-                        exists = Dividend.query.filter_by(
-                            user_id=user_id, 
-                            symbol=symbol, 
-                            ex_dividend_date=ex_date_native
-                        ).first()
-
-                        if not exists:
-                            # 3. 신규 배당 기록 추가
-                            total_amount = float(amount_per_share) * quantity_on_ex_date
-                            new_dividend = Dividend(
-                                symbol=symbol,
-                                amount=total_amount,
-                                amount_per_share=float(amount_per_share),
-                                dividend_date=ex_date_native, # 임시로 배당락일을 지급일로 사용
-                                ex_dividend_date=ex_date_native,
-                                user_id=user_id
-                            )
-                            db.session.add(new_dividend)
-                            total_new_dividends += 1
-                
-                except Exception as e:
-                    logger.error(f"User {user_id}, Symbol {symbol} 처리 중 오류: {e}")
-                    db.session.rollback()
-            
-            # 모든 종목 처리 후 최종 커밋
-            if total_new_dividends > 0:
+                    # 3. 신규 배당 기록 추가
+                    new_dividends.append(Dividend(
+                        symbol=symbol,
+                        amount=float(amount_per_share) * quantity_on_ex_date,
+                        amount_per_share=float(amount_per_share),
+                        dividend_date=ex_date_native, # 임시로 배당락일을 지급일로 사용
+                        ex_dividend_date=ex_date_native,
+                        user_id=user_id
+                    ))
+                    existing_ex_dates.add((symbol, ex_date_native))
+
+            # 다시 계산한 종목의 기존 기록 삭제와 신규 기록 추가를 한 번에 커밋
+            deleted = 0
+            for symbol in rebuilt_symbols:
+                deleted += Dividend.query.filter(
+                    Dividend.user_id == user_id, Dividend.symbol == symbol, Dividend.ex_dividend_date >= rebuild_since[symbol]
+                ).delete(synchronize_session=False)
+            if new_dividends or deleted:
+                db.session.add_all(new_dividends)
                 db.session.commit()
-                logger.info(f"User {user_id}: 신규 배당금 {total_new_dividends}건을 추가했습니다.")
+                bump_portfolio_version(user_id)
+                logger.info(f"User {user_id}: 배당금 {len(new_dividends)}건을 추가했습니다 (다시 계산하며 삭제한 기록 {deleted}건).")
 
             # 업데이트 시점 기록
             if not last_update_record:
@@ -121,3 +163,52 @@ def update_all_dividends_for_user(user_id):
         except Exception as e:
             logger.error(f"User {user_id}의 전체 배당금 업데이트 작업 실패: {e}")
             db.session.rollback()
+
+
+def _iter_upload_lines(redis_client, key, chunk_size=64 * 1024):
+    """Redis에 저장된 업로드 파일을 GETRANGE로 조금씩 읽어 텍스트 줄 단위로 생성."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    offset, pending = 0, ''
+    while True:
+        chunk = redis_client.getrange(key, offset, offset + chunk_size - 1)
+        offset += len(chunk)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = pending.splitlines(keepends=True)
+        pending = lines.pop() if lines and chunk and not lines[-1].endswith('\n') else ''
+        yield from lines
+        if not chunk:
+            if pending:
+                yield pending
+            return
+
+
+def import_trades_job(user_id, upload_key, skip_duplicates=True):
+    """
+    대용량 거래 CSV 가져오기 백그라운드 작업.
+    진행 상황은 job.meta(stage, processed, total)에 기록되어 /trades/import/status에서 조회된다.
+    """
+    from rq import get_current_job
+    from services.trade_import_service import import_trades, TradeImportError
+
+    job = get_current_job()
+
+    def report(stage, processed, total=None):
+        if job:
+            job.meta.update({'stage': stage, 'processed': processed, 'total': total})
+            job.save_meta()
+
+    with app.app_context():
+        redis_client = job.connection if job else None
+        try:
+            result = import_trades(user_id, _iter_upload_lines(redis_client, upload_key), skip_duplicates=skip_duplicates, progress=report)
+        except TradeImportError as e:
+            return {'imported': 0, 'errors': e.errors}
+        finally:
+            if redis_client:
+                redis_client.delete(upload_key)
+
+        report('dividends', result['imported'], result['imported'])
+        if result['imported']:
+            update_all_dividends_for_user(user_id, force=True, rebuild_since=result['rebuild_since'])
+        report('done', result['imported'], result['imported'])
+        return result
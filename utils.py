@@ -1,12 +1,17 @@
 # 📄 utils.py
 
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
+from types import SimpleNamespace
 import logging
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import json
 from redis import Redis
+from sqlalchemy import tuple_, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
 from models import StockPrice
+from cache import market_cache
 
 try:
     from app import conn as redis_conn
@@ -17,60 +22,165 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 def get_from_redis_cache(key):
-    if not redis_conn: return None
-    cached = redis_conn.get(key)
+    cached = market_cache.redis_call(lambda r: r.get(key))
     return json.loads(cached) if cached else None
 
 def set_to_redis_cache(key, value, ttl_hours=6):
-    if not redis_conn: return
-    redis_conn.setex(key, timedelta(hours=ttl_hours), json.dumps(value))
+    market_cache.redis_call(lambda r: r.setex(key, timedelta(hours=ttl_hours), json.dumps(value)))
 
+# Redis 장애 중 반영하지 못한 포트폴리오 버전 증가. 복구 후 다음 버전 조회/증가 때 먼저 반영하여
+# 장애 이전 버전으로 저장된 스냅샷/조각 캐시가 다시 사용되지 않게 한다 (프로세스 단위)
+_pending_version_bumps = set()
 
-def calculate_dividend_metrics(holdings, price_data_map):
+def _apply_pending_version_bumps(redis):
+    for user_id in list(_pending_version_bumps):
+        redis.incr(f"portfolio_version:{user_id}")
+        _pending_version_bumps.discard(user_id)
+
+def get_portfolio_version(user_id):
+    """
+    사용자의 거래/배당 데이터 버전. 거래나 배당이 변경될 때마다 증가하며,
+    사용자 단위 캐시 키에 포함되어 이전 버전의 캐시를 자연스럽게 무효화한다.
+    Redis를 사용할 수 없으면 0 (이때는 버전 키를 쓰는 캐시도 읽거나 쓰지 않는다).
+    """
+    def command(redis):
+        if _pending_version_bumps:
+            _apply_pending_version_bumps(redis)
+        return redis.get(f"portfolio_version:{user_id}")
+    version = market_cache.redis_call(command)
+    return int(version) if version else 0
+
+def bump_portfolio_version(user_id):
+    def command(redis):
+        if _pending_version_bumps:
+            _apply_pending_version_bumps(redis)
+        return redis.incr(f"portfolio_version:{user_id}")
+    if market_cache.redis_call(command) is None and market_cache.redis is not None:
+        _pending_version_bumps.add(user_id)
+
+def encode_cursor(row_date, row_id):
+    return f"{row_date.isoformat()}:{row_id}"
+
+def decode_cursor(cursor):
+    """'YYYY-MM-DD:id' 형식의 페이지 커서를 (date, id)로 변환. 잘못된 값이면 None."""
+    try:
+        row_date, row_id = cursor.rsplit(':', 1)
+        return date.fromisoformat(row_date), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+def keyset_paginate(query, date_column, id_column, after=None, before=None, per_page=50):
+    """
+    (날짜, id) 내림차순 키셋(seek) 페이지네이션.
+    OFFSET 없이 커서 이후/이전 행만 (user_id, 날짜, id) 복합 인덱스로 찾아 읽으므로 페이지 깊이와 무관하게 일정한 비용이 든다.
+    after 커서는 다음(더 오래된) 페이지, before 커서는 이전(더 최근) 페이지를 조회한다.
+    """
+    key = tuple_(date_column, id_column)
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before:
+        rows = query.filter(key > before).order_by(date_column.asc(), id_column.asc()).limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    else:
+        if after:
+            query = query.filter(key < after)
+        rows = query.order_by(date_column.desc(), id_column.desc()).limit(per_page + 1).all()
+        has_prev, has_next = bool(after), len(rows) > per_page
+        rows = rows[:per_page]
+
+    def cursor_of(row):
+        return encode_cursor(getattr(row, date_column.key), getattr(row, id_column.key))
+
+    return SimpleNamespace(
+        items=rows,
+        has_prev=has_prev and bool(rows),
+        has_next=has_next and bool(rows),
+        prev_cursor=cursor_of(rows[0]) if rows else None,
+        next_cursor=cursor_of(rows[-1]) if rows else None,
+    )
+
+
+def upsert_rows(model, rows, key_columns, update_columns=()):
+    """
+    rows(dict 리스트)를 한 번의 executemany로 저장. key_columns(유니크 제약)가 같은 행이 이미 있으면
+    update_columns만 갱신하고, update_columns가 비어 있으면 그 행은 건너뛴다.
+    같은 행을 동시에 넣는 요청이 있어도 IntegrityError가 나지 않도록 PostgreSQL/SQLite의 ON CONFLICT를 사용한다.
+    커밋은 호출하는 쪽에서 한다.
+    """
+    if not rows: return
+    dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(db.session.get_bind().dialect.name)
+    if dialect_insert is None:
+        # ON CONFLICT를 지원하지 않는 DB는 일반 insert (충돌 시 IntegrityError)
+        db.session.execute(insert(model), rows)
+        return
+    statement = dialect_insert(model)
+    if update_columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key_columns), set_={column: statement.excluded[column] for column in update_columns})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=list(key_columns))
+    db.session.execute(statement, rows)
+
+
+def lttb_downsample(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets 다운샘플링. 유지할 점의 인덱스 배열을 반환한다.
+    첫/마지막 점은 항상 유지하고, 나머지 점을 threshold-2개 구간으로 나눠 구간마다
+    (직전에 선택한 점, 다음 구간의 평균점)과 이루는 삼각형 넓이가 가장 큰 점 하나를 고른다.
+    고점/저점 같은 시각적으로 중요한 점이 남으므로 단순 간격 추출보다 차트 모양이 잘 보존된다.
+    x축은 데이터 순서(거래일 인덱스)를 사용한다.
+    """
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=float)
+    # 가운데 n-2개 점을 threshold-2개 구간으로 나누는 경계 (구간 크기가 1보다 크므로 빈 구간이 없음)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    edges = np.append(edges, n)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, max(edges[i + 2], end + 1)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def _current_price_from(price_data):
+    if isinstance(price_data, dict):
+        return price_data.get('price') or 0
+    if hasattr(price_data, 'current_price'):
+        return price_data.current_price
+    return 0
+
+def annual_dps_from_info(info, price_data=None):
+    """yfinance info에서 연간 주당 배당금을 추출. 배당률만 있으면 현재가로 환산."""
+    if not info: return 0
+    annual_dps = float(info.get('trailingAnnualDividendRate') or info.get('dividendRate') or 0)
+    if annual_dps == 0 and info.get('yield'):
+        current_price = _current_price_from(price_data)
+        if current_price:
+            annual_dps = float(info['yield']) * current_price
+    return annual_dps
+
+def calculate_dividend_metrics(holdings, price_data_map, annual_dps_map):
+    """
+    보유 종목별 배당 지표 계산. 연간 주당 배당금(annual_dps_map)은
+    요청 단위 로더(MarketDataLoader)가 일괄 조회한 값을 사용한다.
+    """
     dividend_metrics = {}
     for h in holdings:
         symbol = h.symbol.upper()
-        cache_key = f"dividend_metrics:{symbol}"
-        
-        annual_dps = 0
-        cached_data = get_from_redis_cache(cache_key)
-
-        if cached_data:
-            annual_dps = cached_data.get('annual_dps', 0)
-        else:
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                annual_dps = float(info.get('trailingAnnualDividendRate') or info.get('dividendRate') or 0)
-                
-                if annual_dps == 0 and info.get('yield'):
-                    price_data = price_data_map.get(symbol)
-                    current_price = 0
-                    if isinstance(price_data, dict):
-                        current_price = price_data.get('price')
-                    elif hasattr(price_data, 'current_price'):
-                        current_price = price_data.current_price
-                    
-                    if current_price:
-                        annual_dps = float(info['yield']) * current_price
-
-                if annual_dps > 0:
-                    set_to_redis_cache(cache_key, {'annual_dps': annual_dps})
-            except Exception as e:
-                logger.warning(f"({symbol}) 배당 지표 계산 실패: {e}")
-                continue
-
+        annual_dps = annual_dps_map.get(symbol) or 0
         if annual_dps > 0:
-            price_data = price_data_map.get(symbol)
-            current_price = 0
-            if isinstance(price_data, dict):
-                current_price = price_data.get('price')
-            elif hasattr(price_data, 'current_price'): 
-                current_price = price_data.current_price
-            
-            if not current_price:
-                current_price = h.purchase_price
-
+            current_price = _current_price_from(price_data_map.get(symbol)) or h.purchase_price
             dividend_yield = (annual_dps / current_price) * 100 if current_price else 0
             dividend_metrics[symbol] = {
                 'expected_annual_dividend': annual_dps * h.quantity,
@@ -80,48 +190,31 @@ def calculate_dividend_metrics(holdings, price_data_map):
             
     return dividend_metrics
 
-def get_dividend_payout_schedule(symbol):
+def build_dividend_payout_schedule(dividends):
     """
-    과거 1년간의 배당금 지급 내역과 월 이름 목록을 함께 반환.
+    배당락일을 인덱스로 하는 배당금 Series로부터 과거 1년간의 배당금 지급 내역과 월 이름 목록을 생성.
     """
-    upper_symbol = symbol.upper()
-    cache_key = f"dividend_payout_schedule:{upper_symbol}"
-    
-    cached_data = get_from_redis_cache(cache_key)
-    if cached_data: 
-        return cached_data
-
     payouts = []
     month_names = []
-    try:
-        ticker = yf.Ticker(upper_symbol)
-        actions = ticker.actions
-        if actions is not None and not actions.empty and 'Dividends' in actions.columns:
-            dividends_data = actions[actions['Dividends'] > 0]
-            if not dividends_data.empty:
-                one_year_ago = datetime.now() - timedelta(days=365)
-                if dividends_data.index.tz is not None:
-                    dividends_data.index = dividends_data.index.tz_convert(None)
-                
-                recent_dividends = dividends_data[dividends_data.index > pd.to_datetime(one_year_ago)]
-                for ex_date, row in recent_dividends.iterrows():
-                    payouts.append({
-                        'date': ex_date.strftime('%Y-%m-%d'),
-                        'amount': row['Dividends']
-                    })
-
-                # 🛠️ Refactoring: 월 이름 목록 계산 로직을 이 함수로 이전
-                payout_months_num = sorted(list(set(datetime.strptime(p['date'], '%Y-%m-%d').month for p in payouts)))
-                MONTH_MAP = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun', 7: 'Jul', 8: 'Aug', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'}
-                month_names = [MONTH_MAP[m] for m in payout_months_num]
-
-    except Exception as e:
-        logger.warning(f"({upper_symbol}) 배당 지급 일정 조회 실패: {e}")
-
-    # 🛠️ Refactoring: 반환 값 구조를 딕셔너리로 변경
-    result = {'payouts': payouts, 'months': month_names}
-    set_to_redis_cache(cache_key, result)
-    return result
+    if dividends is not None:
+        dividends = dividends[dividends > 0]
+        if not dividends.empty:
+            one_year_ago = datetime.now() - timedelta(days=365)
+            if dividends.index.tz is not None:
+                dividends.index = dividends.index.tz_convert(None)
+
+            recent_dividends = dividends[dividends.index > pd.to_datetime(one_year_ago)]
+            for ex_date, amount in recent_dividends.items():
+                payouts.append({
+                    'date': ex_date.strftime('%Y-%m-%d'),
+                    'amount': float(amount)
+                })
+
+            payout_months_num = sorted(list(set(datetime.strptime(p['date'], '%Y-%m-%d').month for p in payouts)))
+            MONTH_MAP = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun', 7: 'Jul', 8: 'Aug', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'}
+            month_names = [MONTH_MAP[m] for m in payout_months_num]
+
+    return {'payouts': payouts, 'months': month_names}
 
 def get_dividend_allocation_data(dividend_metrics):
     return [{'symbol': s, 'value': m['expected_annual_dividend']} for s, m in dividend_metrics.items() if m.get('expected_annual_dividend', 0) > 0]